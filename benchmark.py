@@ -0,0 +1,174 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+import othello
+
+# the positions the agents are benchmarked on, from the perft positions
+POSITIONS = ["opening", "midgame", "endgame"]
+
+# (agent, depths) pairs to benchmark.  the greedy and one depth players don't take a depth
+CASES = [
+    ("greedy", [None]),
+    ("minimax1", [None]),
+    ("ndepth", [1]),
+    ("pruning", [1, 2]),
+    ("heuristic", [1, 2]),
+]
+
+# how much worse than the baseline a result may get before it counts as a regression (0.25 is 25%)
+DEFAULT_TOLERANCES = {"seconds": 0.5, "nodes": 0.0, "peak_memory": 0.5}
+
+DEFAULT_BASELINE = os.path.join(
+    os.path.dirname(__file__), "benchmarks", "baseline.json"
+)
+
+
+# finds one move with an agent, counting the boards it searches in budget
+def run_agent(agent, depth, board, turn, budget):
+    move_list = board.valid_moves(turn)
+    if agent == "greedy":
+        return othello.get_greedy_move(board, move_list, turn, budget=budget)
+    elif agent == "minimax1":
+        return othello.get_mini_max_move_one_depth(board, move_list, turn, budget)
+    elif agent == "ndepth":
+        return othello.get_mini_max_move_n_depth(
+            board, move_list, turn, depth, budget=budget
+        )
+    elif agent == "pruning":
+        return othello.get_mini_max_move_n_depth_pruning(
+            board, turn, depth, budget=budget
+        )
+    elif agent == "heuristic":
+        return othello.get_mini_max_move_n_depth_pruning_heuristic(
+            board, turn, depth, budget=budget
+        )
+    raise ValueError(f"unknown agent {agent}")
+
+
+# name of a benchmark result, like heuristic:2/midgame
+def case_name(agent, depth, position):
+    if depth is None:
+        return f"{agent}/{position}"
+    return f"{agent}:{depth}/{position}"
+
+
+# benchmarks one agent on one position.  the time is the best of repeat runs, and the peak memory
+# comes from one more run under tracemalloc (which slows the search down too much to time it)
+def measure(agent, depth, position, repeat=3):
+    board, turn = othello.board_from_moves(othello.PERFT_POSITIONS[position])
+    seconds = None
+    for _ in range(repeat):
+        random.seed(0)
+        budget = othello.SearchBudget()
+        started = time.perf_counter()
+        run_agent(agent, depth, board, turn, budget)
+        elapsed = time.perf_counter() - started
+        if seconds is None or elapsed < seconds:
+            seconds = elapsed
+
+    random.seed(0)
+    tracemalloc.start()
+    run_agent(agent, depth, board, turn, othello.SearchBudget())
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {"seconds": seconds, "nodes": budget.nodes, "peak_memory": peak_memory}
+
+
+# runs every case on every position.  returns name -> measurements
+def run_benchmarks(cases=CASES, positions=POSITIONS, repeat=3, verbose=False):
+    results = {}
+    for agent, depths in cases:
+        for depth in depths:
+            for position in positions:
+                name = case_name(agent, depth, position)
+                results[name] = measure(agent, depth, position, repeat)
+                if verbose:
+                    print(format_result(name, results[name]))
+    return results
+
+
+def format_result(name, result):
+    return (
+        f"{name:24} {result['seconds'] * 1000:10.2f} ms {result['nodes']:9} nodes"
+        f" {result['peak_memory'] / 1024:9.1f} KiB"
+    )
+
+
+# compares results against a baseline.  returns a list of (name, measure, baseline value, value)
+# for everything that got worse by more than its tolerance.  cases missing from either side are skipped
+def find_regressions(results, baseline, tolerances=DEFAULT_TOLERANCES):
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for key, tolerance in tolerances.items():
+            allowed = baseline[name][key] * (1 + tolerance)
+            if result[key] > allowed:
+                regressions.append((name, key, baseline[name][key], result[key]))
+    return regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the othello agents and compare against a baseline"
+    )
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="overwrite the baseline with these results instead of comparing",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    for key, tolerance in DEFAULT_TOLERANCES.items():
+        parser.add_argument(
+            "--%s-tolerance" % key.replace("_", "-"),
+            dest=f"{key}_tolerance",
+            type=float,
+            default=tolerance,
+        )
+    args = parser.parse_args(args)
+
+    results = run_benchmarks(repeat=args.repeat, verbose=True)
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(report, file, indent=2)
+        return 0
+
+    try:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+    except FileNotFoundError:
+        print(f"\nno baseline at {args.baseline}, nothing to compare against")
+        return 0
+
+    tolerances = {key: getattr(args, f"{key}_tolerance") for key in DEFAULT_TOLERANCES}
+    regressions = find_regressions(results, baseline, tolerances)
+    if len(regressions) == 0:
+        print("\nno regressions against", args.baseline)
+        return 0
+    print("\nregressions against", args.baseline)
+    for name, key, old, new in regressions:
+        print(f"{name:24} {key:12} {old:.6g} -> {new:.6g}")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,15 @@
+import argparse
+import json
+import math
+import mmap
+import multiprocessing
+import os
 import random
+import struct
+import threading
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from enum import Enum
 
 
@@ -8,43 +19,165 @@ class GameType(Enum):
     GREEDY = 2
     MINIMAX_1DEPTH = 3
     MINIMAX_NDEPTH = 4
-    EXIT_GAME = 5
+    MCTS = 5
+    EXIT_GAME = 6
 
 
 class Optimization(Enum):
     ALPHA_BETA = 0  # Alpha-Beta pruning, allowing for deeper searches
     HEURISTIC = 1  # A better evaluation heuristic
     PRUNING = 4  # Pruning of previously seen board states
+    ITERATIVE_DEEPENING = 5  # Deeper and deeper searches until a time limit runs out
+    PARALLEL = 6  # Searching the first moves in parallel, on every CPU core
+
+
+# the board is 10x10 and squares are numbered row by row: x,y lives at index x + y * 10
+# a bitboard is an int with bit x + y * 10 set for every square holding a given color
+FULL_MASK = (1 << 100) - 1
+
+# every square except the ones in the leftmost and rightmost columns.  sideways and diagonal
+# shifts would wrap from one row onto the next, and any wrapped bit lands in one of those columns
+INNER_COLUMNS_MASK = 0
+for _y in range(10):
+    for _x in range(1, 9):
+        INNER_COLUMNS_MASK |= 1 << (_x + _y * 10)
+
+# the 8 directions as x,y steps
+STEPS = [(0, -1), (0, 1), (-1, -1), (-1, 0), (-1, 1), (1, -1), (1, 0), (1, 1)]
+
+# the same directions as (bit shift, mask applied to the discs a line may run through)
+DIRECTIONS = [
+    (dx + dy * 10, INNER_COLUMNS_MASK if dx != 0 else FULL_MASK) for dx, dy in STEPS
+]
+
+# number of set bits in a bitboard.  int.bit_count is the fast way, but it needs python 3.10
+if hasattr(int, "bit_count"):
+    popcount = int.bit_count
+else:
+
+    def popcount(bits):
+        return bin(bits).count("1")
+
+
+# for each of the 100 squares, the 8 rays leaving it as tuples of square indices, nearest square first.
+# rays shorter than 2 squares can never capture anything, so they are left out
+RAYS = []
+for _i in range(100):
+    _rays = []
+    for _dx, _dy in STEPS:
+        _ray = []
+        _x, _y = _i % 10 + _dx, _i // 10 + _dy
+        while 0 <= _x < 10 and 0 <= _y < 10:
+            _ray.append(_x + _y * 10)
+            _x, _y = _x + _dx, _y + _dy
+        if len(_ray) >= 2:
+            _rays.append(tuple(_ray))
+    RAYS.append(tuple(_rays))
+RAYS = tuple(RAYS)
+
+# for each of the 100 squares, a bitboard of the (up to 8) squares around it
+NEIGHBORS = []
+for _i in range(100):
+    _neighbors = 0
+    for _dx, _dy in STEPS:
+        _x, _y = _i % 10 + _dx, _i // 10 + _dy
+        if 0 <= _x < 10 and 0 <= _y < 10:
+            _neighbors |= 1 << (_x + _y * 10)
+    NEIGHBORS.append(_neighbors)
+NEIGHBORS = tuple(NEIGHBORS)
+
+
+# zobrist keys: one random 64 bit number per square and color, plus one for the side to move.
+# a board's hash is the xor of the keys of its pieces, so a move only needs to xor in the squares it changes.
+# the generator is seeded so hashes are the same in every run
+_zobrist_random = random.Random(2020)
+ZOBRIST = {
+    1: tuple(_zobrist_random.getrandbits(64) for _ in range(100)),
+    -1: tuple(_zobrist_random.getrandbits(64) for _ in range(100)),
+}
+ZOBRIST_SIDE = _zobrist_random.getrandbits(64)
 
 
 # this class stores an othello board state
-# the state is handled as a 1d list that stores a 10x10 board.  1 and -1 are the two colors, 0 are empty squares
+# the state is handled as a 1d array of signed bytes that stores a 10x10 board.  1 and -1 are the two colors,
+# 0 are empty squares.  alongside the array, the board keeps one bitboard per color so moves can be generated
+# with a few shifts.  searches make a lot of boards, so there are no per board attribute dicts (__slots__)
+# and the state takes one byte per square instead of a list of 100 references
 class Board:
+    __slots__ = (
+        "_state",
+        "x_bits",
+        "o_bits",
+        "hash",
+        "x_count",
+        "o_count",
+        "empty_count",
+        "frontier",
+        "x_moves",
+        "o_moves",
+    )
+
     # make a starting board.  There are four pieces in the center
     def __init__(self):
-        self.state = [0] * 100
-        self.state[44] = 1
-        self.state[45] = -1
-        self.state[54] = -1
-        self.state[55] = 1
+        state = [0] * 100
+        state[44] = 1
+        state[45] = -1
+        state[54] = -1
+        state[55] = 1
+        self.state = state
+
+    # the state array.  any sequence of 100 squares (like a list) can be assigned, it is copied into
+    # a new array and the bitboards are rebuilt, so always assign a whole state instead of editing
+    # single squares from outside the class
+    @property
+    def state(self):
+        return self._state
+
+    @state.setter
+    def state(self, state):
+        self._state = array("b", state)
+        # the bitboards of X (1) and of O (-1), and their numbers of pieces.  scalar slots instead of
+        # dicts keyed by color, so copies and moves don't allocate any
+        bits = {1: 0, -1: 0}
+        counts = {1: 0, -1: 0}
+        self.hash = 0
+        # number of empty squares
+        self.empty_count = 100
+        # the empty squares next to a piece.  every move is on one of them
+        self.frontier = 0
+        for i in range(100):
+            if state[i] != 0:
+                bits[state[i]] |= 1 << i
+                self.hash ^= ZOBRIST[state[i]][i]
+                counts[state[i]] += 1
+                self.empty_count -= 1
+                self.frontier |= NEIGHBORS[i]
+        self.x_bits = bits[1]
+        self.o_bits = bits[-1]
+        self.x_count = counts[1]
+        self.o_count = counts[-1]
+        self.frontier &= ~(self.x_bits | self.o_bits)
+        # move_mask of X and of O, worked out the first time it is needed
+        self.x_moves = None
+        self.o_moves = None
+
+    # the bitboards by color, for reading.  the board itself keeps them in x_bits and o_bits
+    @property
+    def bitboards(self):
+        return {1: self.x_bits, -1: self.o_bits}
+
+    # the numbers of pieces by color, for reading.  the board itself keeps them in x_count and o_count
+    @property
+    def counts(self):
+        return {1: self.x_count, -1: self.o_count}
 
     # returns the score as the difference between the number of 1s and the number of -1s
     def evaluate(self) -> int:
-        value = 0
-        for i in range(100):
-            if self.state[i] == 1:
-                value = value + 1
-            elif self.state[i] == -1:
-                value = value - 1
-        return value
+        return self.x_count - self.o_count
 
     # Calculates the score for a specific player
     def calculate_score(self, player):
-        score = 0
-        for i in range(100):
-            if self.state[i] == player:
-                score += 1
-        return score
+        return self.x_count if player == 1 else self.o_count
 
     # swaps player
     def other_player(self, turn):
@@ -53,15 +186,22 @@ class Board:
     # score gives a value to the board from the point of view of the player
     # this one actually calculates the difference between the player and the opponent
     def score(self, player):
-        player_score = self.calculate_score(player)
-        other_player_score = self.calculate_score(self.other_player(player))
-        return player_score - other_player_score
+        return (self.x_count - self.o_count) * player
 
     # returns a new board that is a copy of the current board
     def copy(self):
-        board = Board()
-        for i in range(100):
-            board.state[i] = self.state[i]
+        board = Board.__new__(Board)
+        # slicing copies the whole array in one go
+        board._state = self._state[:]
+        board.x_bits = self.x_bits
+        board.o_bits = self.o_bits
+        board.hash = self.hash
+        board.x_count = self.x_count
+        board.o_count = self.o_count
+        board.empty_count = self.empty_count
+        board.frontier = self.frontier
+        board.x_moves = self.x_moves
+        board.o_moves = self.o_moves
         return board
 
     # given a x,y position, returns the tile within the 1d list
@@ -72,92 +212,211 @@ class Board:
             # out of bounds, return -2 for error
             return -2
 
+    # returns a bitboard with every square where id can place a piece.  with stop_early it returns
+    # as soon as one direction gives a move, so it may leave moves out
+    def move_mask(self, id, stop_early=False) -> int:
+        cached = self.x_moves if id == 1 else self.o_moves
+        if cached is not None:
+            return cached
+        if id == 1:
+            own, opponent = self.x_bits, self.o_bits
+        else:
+            own, opponent = self.o_bits, self.x_bits
+        # a line can only end on an empty square next to a piece
+        empty = self.frontier
+        moves = 0
+        for shift, mask in DIRECTIONS:
+            line_mask = opponent & mask
+            # grow a line of opponent pieces out from each of our pieces, one square at a time.
+            # the square right after the end of a line is a move if it is empty
+            if shift > 0:
+                line = (own << shift) & line_mask
+                while line:
+                    grown = line | ((line << shift) & line_mask)
+                    if grown == line:
+                        break
+                    line = grown
+                moves |= (line << shift) & empty
+            else:
+                shift = -shift
+                line = (own >> shift) & line_mask
+                while line:
+                    grown = line | ((line >> shift) & line_mask)
+                    if grown == line:
+                        break
+                    line = grown
+                moves |= (line >> shift) & empty
+            if stop_early and moves:
+                return moves
+        if id == 1:
+            self.x_moves = moves
+        else:
+            self.o_moves = moves
+        return moves
+
+    # whether id can move at all.  cheaper than valid_moves when all that matters is if a player
+    # has to pass, since it stops at the first direction with a move
+    def has_any_move(self, id) -> bool:
+        return self.move_mask(id, True) != 0
+
+    # returns the indices of the pieces that id would flip by placing at square i (empty if the move is not valid)
+    def flipped_squares(self, i, id) -> list:
+        # squares that aren't on the frontier are taken, or have no piece around them to capture
+        if not (self.frontier >> i) & 1:
+            return []
+        state = self._state
+        flips = []
+        for ray in RAYS[i]:
+            # move one space.  is the piece the opponent's color?
+            if state[ray[0]] != -id:
+                continue
+            # keep going until we hit something that isn't an opponent piece
+            for j in range(1, len(ray)):
+                value = state[ray[j]]
+                if value == -id:
+                    continue
+                # if we found a piece of our own color, everything in between flips
+                if value == id:
+                    flips.extend(ray[:j])
+                break
+        return flips
+
     # given an x,y coordinate, and an id of 1 or -1, returns true if this is a valid move
     def can_place(self, x, y, id) -> bool:
+        if not (0 <= x < 10 and 0 <= y < 10):
+            return False
+        state = self._state
+        i = x + y * 10
         # square is not empty? return false
-        if self.index(x, y) != 0:
+        if state[i] != 0:
             return False
-        # these functions compute the 8 different directions
-        dirs = [
-            (lambda x: x, lambda y: y - 1),
-            (lambda x: x, lambda y: y + 1),
-            (lambda x: x - 1, lambda y: y - 1),
-            (lambda x: x - 1, lambda y: y),
-            (lambda x: x - 1, lambda y: y + 1),
-            (lambda x: x + 1, lambda y: y - 1),
-            (lambda x: x + 1, lambda y: y),
-            (lambda x: x + 1, lambda y: y + 1),
-        ]
-        # for each direction...
-        for xop, yop in dirs:
+        for ray in RAYS[i]:
             # move one space.  is the piece the opponent's color?
-            i, j = xop(x), yop(y)
-            if self.index(i, j) != -id:
-                # no, then we'll move on to the next direction
+            if state[ray[0]] != -id:
                 continue
             # keep going until we hit our own piece
-            i, j = xop(i), yop(j)
-            while self.index(i, j) == -id:
-                i, j = xop(i), yop(j)
-            # if we found a piece of our own color, then this is a valid move
-            if self.index(i, j) == id:
-                return True
+            for j in ray[1:]:
+                value = state[j]
+                if value == -id:
+                    continue
+                # if we found a piece of our own color, then this is a valid move
+                if value == id:
+                    return True
+                break
         return False  # if I can't capture in any direction, I can't place here
 
     # given an x,y coordinate, and an id of 1 or -1, place a tile (if valid) at x,y, and modify the state accordingly
     def place(self, x, y, id):
+        self.make_move(x, y, id)
+
+    # same as place, but returns what is needed to take the move back with unmake_move:
+    # the placed square, the list of flipped squares, the frontier and the move masks before the move.
+    # returns None if the move isn't valid
+    def make_move(self, x, y, id):
         # don't bother if it isn't a valid move
-        if not self.can_place(x, y, id):
-            return
-        # place your piece at x,y
-        self.state[x + y * 10] = id
-        dirs = [
-            (lambda x: x, lambda y: y - 1),
-            (lambda x: x, lambda y: y + 1),
-            (lambda x: x - 1, lambda y: y - 1),
-            (lambda x: x - 1, lambda y: y),
-            (lambda x: x - 1, lambda y: y + 1),
-            (lambda x: x + 1, lambda y: y - 1),
-            (lambda x: x + 1, lambda y: y),
-            (lambda x: x + 1, lambda y: y + 1),
-        ]
-        # go through each direction
-        for xop, yop in dirs:
-            i, j = xop(x), yop(y)
-            # move one space.  is the piece the opponent's color?
-            if self.index(i, j) != -id:
-                # no, then we can't capture in this direction.  we'll move on to the next one
-                continue
-            # keep going until we hit our own piece
-            while self.index(i, j) == -id:
-                i, j = xop(i), yop(j)
-            # if we found a piece of our own color, then this is a valid move
-            if self.index(i, j) == id:
-                k, l = xop(x), yop(y)
-                # go back and flip all the pieces to my color
-                while k != i or l != j:
-                    self.state[k + l * 10] = id
-                    k, l = xop(k), yop(l)
+        if not (0 <= x < 10 and 0 <= y < 10):
+            return None
+        i = x + y * 10
+        flips = self.flipped_squares(i, id)
+        if not flips:
+            return None
+        # place your piece at x,y and flip the captured pieces to my color
+        state = self._state
+        own_keys = ZOBRIST[id]
+        opponent_keys = ZOBRIST[-id]
+        state[i] = id
+        flip_mask = 0
+        board_hash = self.hash ^ own_keys[i]
+        for j in flips:
+            state[j] = id
+            flip_mask |= 1 << j
+            board_hash ^= own_keys[j] ^ opponent_keys[j]
+        if id == 1:
+            self.x_bits |= flip_mask | (1 << i)
+            self.o_bits &= ~flip_mask
+            self.x_count += len(flips) + 1
+            self.o_count -= len(flips)
+        else:
+            self.o_bits |= flip_mask | (1 << i)
+            self.x_bits &= ~flip_mask
+            self.o_count += len(flips) + 1
+            self.x_count -= len(flips)
+        self.hash = board_hash
+        self.empty_count -= 1
+        # the square leaves the frontier and its empty neighbors join it.  squares that leave the
+        # frontier when the move is taken back are harder to find, so the old frontier is kept
+        frontier = self.frontier
+        self.frontier = (frontier | NEIGHBORS[i]) & ~(self.x_bits | self.o_bits)
+        # the cached move masks are for the old board.  they are kept for unmake_move to put back
+        x_moves = self.x_moves
+        o_moves = self.o_moves
+        self.x_moves = None
+        self.o_moves = None
+        return (i, flips, frontier, x_moves, o_moves)
+
+    # takes back a move made with make_move.  moves must be taken back in the reverse order they were made
+    def unmake_move(self, undo):
+        i, flips, self.frontier, self.x_moves, self.o_moves = undo
+        state = self._state
+        id = state[i]
+        own_keys = ZOBRIST[id]
+        opponent_keys = ZOBRIST[-id]
+        # empty the placed square and give the flipped pieces back to the opponent
+        state[i] = 0
+        flip_mask = 0
+        board_hash = self.hash ^ own_keys[i]
+        for j in flips:
+            state[j] = -id
+            flip_mask |= 1 << j
+            board_hash ^= own_keys[j] ^ opponent_keys[j]
+        if id == 1:
+            self.x_bits &= ~(flip_mask | (1 << i))
+            self.o_bits |= flip_mask
+            self.x_count -= len(flips) + 1
+            self.o_count += len(flips)
+        else:
+            self.o_bits &= ~(flip_mask | (1 << i))
+            self.x_bits |= flip_mask
+            self.o_count -= len(flips) + 1
+            self.x_count += len(flips)
+        self.hash = board_hash
+        self.empty_count += 1
 
     # returns a list of all valid x,y moves for a given id
     def valid_moves(self, id) -> list:
         moves = []
-        for x in range(10):
-            for y in range(10):
-                if self.can_place(x, y, id):
-                    moves = moves + [(x, y)]
+        mask = self.move_mask(id)
+        while mask:
+            lowest = mask & -mask
+            i = lowest.bit_length() - 1
+            moves.append((i % 10, i // 10))
+            mask ^= lowest
+        # same x-then-y order as scanning the board column by column
+        moves.sort()
         return moves
 
+    # yields the valid moves of id one at a time, best squares first (corners, then edges, and the
+    # squares next to the corners last).  searches that cut off after a move or two never build the
+    # moves they don't look at.  mask is the move_mask if it is already known, and first is a move
+    # to yield before the others (like the best move from the transposition table), if it is valid
+    def iter_moves(self, id, mask=None, first=None):
+        if mask is None:
+            mask = self.move_mask(id)
+        if first is not None:
+            bit = 1 << (first[0] + first[1] * 10)
+            if mask & bit:
+                yield first
+                mask ^= bit
+        for group in PRIORITY_GROUPS:
+            squares = mask & group
+            while squares:
+                lowest = squares & -squares
+                i = lowest.bit_length() - 1
+                yield (i % 10, i // 10)
+                squares ^= lowest
+
     def valid_moves_mini_max(self, id, maximizing=True) -> list:
-        moves = []
-        for x in range(10):
-            for y in range(10):
-                if self.can_place(x, y, id):
-                    if maximizing:
-                        moves = moves + [(None, (x, y))]
-                    else:
-                        moves = moves + [(None, (x, y))]
-        return moves
+        return [(None, move) for move in self.valid_moves(id)]
 
     # returns valid moves with associated scores
     def scored_valid_moves(self, id, score_for=1):
@@ -176,8 +435,8 @@ class Board:
 
     # number of next moves a player has, given the current state of the game
     def heuristic_mobility(self, player):
-        player_mobility = len(self.valid_moves(player))
-        opponent_mobility = len(self.valid_moves(self.other_player(player)))
+        player_mobility = popcount(self.move_mask(player))
+        opponent_mobility = popcount(self.move_mask(self.other_player(player)))
 
         if player_mobility + opponent_mobility != 0:
             return (
@@ -192,12 +451,27 @@ class Board:
     def calculate_heuristic(self, player):
         return self.heuristic_mobility(player) + self.heuristic_token_parity(player)
 
+    # a compact key for the board: the pieces of 1 in the low 100 bits of an int and the pieces of -1
+    # in the 100 bits above them.  it takes a shift and an or to build, and hashes like any int, so
+    # boards can be kept in dicts and sets cheaply.  Board.from_key turns it back into a board
+    def key(self):
+        return self.x_bits | (self.o_bits << 100)
+
+    @classmethod
+    def from_key(cls, key):
+        state = [0] * 100
+        for i in range(100):
+            if (key >> i) & 1:
+                state[i] = 1
+            elif (key >> (i + 100)) & 1:
+                state[i] = -1
+        board = cls.__new__(cls)
+        board.state = state
+        return board
+
     # get a board id using the board state
     def get_board_id(self):
-        id = ""
-        for (value, index) in enumerate(self.state):
-            id += f"{value}:{index}"
-        return id
+        return self.key()
 
     # print out the board.  1 is X, -1 is O
     def print_board(self):
@@ -231,23 +505,800 @@ class Board:
             print(line)
         print()
 
-    # state is an end game if there are no empty places
+    # state is an end game if there are no empty places, or if neither player can move
     def end(self):
-        if len(self.valid_moves(1)) == 0 and len(self.valid_moves(-1)) == 0:
+        if self.empty_count == 0:
             return True
-        return not 0 in self.state
+        return not (self.has_any_move(1) or self.has_any_move(-1))
+
+
+# how a stored search value relates to the real value of the board
+class Bound(Enum):
+    EXACT = 0  # the value is exact
+    LOWER = 1  # the search was cut off, the real value is at least this big
+    UPPER = 2  # no move reached alpha, the real value is at most this big
+
+
+# boards are keyed by their zobrist hash and the player to move (or the player a search is scoring for)
+def position_key(board, turn):
+    if turn == 1:
+        return board.hash
+    return board.hash ^ ZOBRIST_SIDE
+
+
+# transposition table: remembers the result of searching a board, so a position reached again
+# through a different order of moves (or on the next turn) doesn't have to be searched from scratch.
+# values depend on the search that produced them, so use one table per search function
+class TranspositionTable:
+    def __init__(self, max_entries=1000000):
+        self.max_entries = max_entries
+        # key -> (depth, bound, value, best move)
+        self.entries = {}
+
+    def key(self, board, turn):
+        return position_key(board, turn)
+
+    # returns (value, move) for a board.  value is only set when the stored search went at least as deep
+    # and its bound settles the alpha-beta window, move is the best move found last time (or None)
+    def probe(self, board, turn, depth, alpha, beta):
+        entry = self.entries.get(self.key(board, turn))
+        if entry is None:
+            return None, None
+        entry_depth, bound, value, move = entry
+        if entry_depth >= depth:
+            if bound == Bound.EXACT:
+                return value, move
+            if bound == Bound.LOWER and value >= beta:
+                return value, move
+            if bound == Bound.UPPER and value <= alpha:
+                return value, move
+        return None, move
+
+    # stores the result of searching a board with the window alpha, beta
+    def store(self, board, turn, depth, alpha, beta, value, move):
+        key = self.key(board, turn)
+        entry = self.entries.get(key)
+        # keep the deeper search when both are around
+        if entry is not None and entry[0] > depth:
+            return
+        if entry is None and len(self.entries) >= self.max_entries:
+            self.entries.clear()
+        if value <= alpha:
+            bound = Bound.UPPER
+        elif value >= beta:
+            bound = Bound.LOWER
+        else:
+            bound = Bound.EXACT
+        self.entries[key] = (depth, bound, value, move)
+
+    def clear(self):
+        self.entries.clear()
+
+
+# static value of each square for move ordering.  corners can never be flipped back, so they come first.
+# the squares touching a corner (X squares on the diagonal, C squares on the edges) usually give the
+# corner away, so they come last.  the other edge squares are better than the middle of the board
+SQUARE_PRIORITY = [0] * 100
+for _i in range(100):
+    _edge_x, _edge_y = min(_i % 10, 9 - _i % 10), min(_i // 10, 9 - _i // 10)
+    if _edge_x == 0 and _edge_y == 0:
+        SQUARE_PRIORITY[_i] = 100
+    elif _edge_x == 1 and _edge_y == 1:
+        SQUARE_PRIORITY[_i] = -50
+    elif min(_edge_x, _edge_y) == 0 and max(_edge_x, _edge_y) == 1:
+        SQUARE_PRIORITY[_i] = -20
+    elif min(_edge_x, _edge_y) == 0:
+        SQUARE_PRIORITY[_i] = 10
+    elif min(_edge_x, _edge_y) == 1:
+        SQUARE_PRIORITY[_i] = -5
+
+# the squares grouped by priority as bitboards, highest priority first
+PRIORITY_GROUPS = []
+for _priority in sorted(set(SQUARE_PRIORITY), reverse=True):
+    _group = 0
+    for _i in range(100):
+        if SQUARE_PRIORITY[_i] == _priority:
+            _group |= 1 << _i
+    PRIORITY_GROUPS.append(_group)
+PRIORITY_GROUPS = tuple(PRIORITY_GROUPS)
+
+
+# move ordering for the alpha-beta searches.  alpha-beta cuts the most when the best move is tried first,
+# so moves are sorted by:
+#   - killer moves: the last moves that caused a cutoff at the same ply.  a move that refutes one line
+#     often refutes its siblings too
+#   - history: how often (weighted by depth) a square caused a cutoff anywhere in the tree
+#   - the static square priority
+class MoveOrdering:
+    def __init__(self, killer_slots=2):
+        self.killer_slots = killer_slots
+        # ply -> list of killer moves, newest first
+        self.killers = {}
+        self.history = [0] * 100
+
+    # returns the moves sorted best first
+    def order(self, moves, ply):
+        killers = self.killers.get(ply, [])
+        history = self.history
+
+        def key(move):
+            i = move[0] + move[1] * 10
+            if move in killers:
+                return (len(killers) - killers.index(move), 0, 0)
+            return (0, history[i], SQUARE_PRIORITY[i])
+
+        return sorted(moves, key=key, reverse=True)
+
+    # called by the searches when a move causes a cutoff
+    def record_cutoff(self, move, ply, depth):
+        killers = self.killers.setdefault(ply, [])
+        if move in killers:
+            killers.remove(move)
+        killers.insert(0, move)
+        del killers[self.killer_slots :]
+        self.history[move[0] + move[1] * 10] += depth * depth
+
+    # halves the history, so cutoffs from old searches count less than new ones
+    def age(self):
+        self.history = [value // 2 for value in self.history]
+
+    def clear(self):
+        self.killers.clear()
+        self.history = [0] * 100
+
+
+# counts what a search did, to see how deep and how well the searches prune.  pass one to a search
+# and read it (or print report()) afterwards.  a stats object can collect several searches, like all
+# the depths of an iterative deepening search
+class SearchStats:
+    def __init__(self):
+        # boards looked at, by how many moves they are away from the board being searched
+        self.nodes_per_ply = []
+        # boards at the bottom of the search, given to the evaluation function
+        self.leaves = 0
+        # calls to the evaluation function: the leaves, plus games that ended before the bottom
+        self.evaluations = 0
+        # boards whose value came from the transposition table
+        self.table_hits = 0
+        # beta cutoffs, and how many happened on the first move tried, the second one, and so on.
+        # good move ordering puts almost all of them on the first move
+        self.cutoffs = 0
+        self.cutoffs_at_move = []
+        # calls to Board.copy made by the searches
+        self.copies = 0
+        # seconds spent searching, in total and for each depth of iterative deepening
+        self.seconds = 0.0
+        self.seconds_per_depth = {}
+
+    @property
+    def nodes(self):
+        return sum(self.nodes_per_ply)
+
+    def visit(self, ply):
+        while len(self.nodes_per_ply) <= ply:
+            self.nodes_per_ply.append(0)
+        self.nodes_per_ply[ply] += 1
+
+    def cutoff(self, index):
+        self.cutoffs += 1
+        while len(self.cutoffs_at_move) <= index:
+            self.cutoffs_at_move.append(0)
+        self.cutoffs_at_move[index] += 1
+
+    # average number of moves searched from each board that wasn't a leaf
+    def branching_factor(self):
+        inner = self.nodes - self.leaves
+        if inner <= 0:
+            return 0.0
+        return (self.nodes - 1) / inner
+
+    def to_dict(self):
+        return {
+            "nodes": self.nodes,
+            "nodes_per_ply": self.nodes_per_ply,
+            "leaves": self.leaves,
+            "evaluations": self.evaluations,
+            "table_hits": self.table_hits,
+            "cutoffs": self.cutoffs,
+            "cutoffs_at_move": self.cutoffs_at_move,
+            "copies": self.copies,
+            "branching_factor": self.branching_factor(),
+            "seconds": self.seconds,
+            "seconds_per_depth": self.seconds_per_depth,
+        }
+
+    def report(self):
+        lines = [
+            f"nodes: {self.nodes} ({self.nodes / max(self.seconds, 1e-9):.0f}/s)"
+            f" in {self.seconds:.3f}s",
+            f"nodes per ply: {self.nodes_per_ply}",
+            f"leaves: {self.leaves}, evaluations: {self.evaluations},"
+            f" table hits: {self.table_hits}, board copies: {self.copies}",
+            f"branching factor: {self.branching_factor():.2f}",
+            f"cutoffs: {self.cutoffs}, by move tried: {self.cutoffs_at_move}",
+        ]
+        for depth, seconds in self.seconds_per_depth.items():
+            lines.append(f"depth {depth}: {seconds:.3f}s")
+        return "\n".join(lines)
+
+
+# raised from inside a search when its budget runs out
+class SearchTimeout(Exception):
+    pass
+
+
+# limits the work a search may do, by wall-clock time, by number of boards looked at, or both.
+# the searches call tick() for every board they look at, and tick() raises SearchTimeout once a limit is hit.
+# stop is a threading.Event another thread can set to end the search early
+class SearchBudget:
+    def __init__(self, time_limit=None, node_limit=None, stop=None):
+        self.start = time.perf_counter()
+        self.deadline = None if time_limit is None else self.start + time_limit
+        self.node_limit = node_limit
+        self.stop = stop
+        self.nodes = 0
+
+    def tick(self):
+        self.nodes += 1
+        if self.node_limit is not None and self.nodes > self.node_limit:
+            raise SearchTimeout()
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+        if self.stop is not None and self.stop.is_set():
+            raise SearchTimeout()
+
+    # seconds left before the deadline (None if there is no time limit)
+    def remaining(self):
+        if self.deadline is None:
+            return None
+        return self.deadline - time.perf_counter()
+
+
+# bigger than any value a board can get
+INFINITY = float("inf")
+
+# at the top level, moves are searched with alpha just under the best value so far.  that way a move
+# that ties with the best one still gets its exact value, and one of the tied moves can be picked at random
+TIE_MARGIN = 1e-6
+
+
+# evaluation for the search engine: the difference in pieces, from the point of view of player
+def evaluate_score(board, player):
+    return board.score(player)
+
+
+# evaluation for the search engine: the difference in pieces plus the mobility and token parity heuristics
+def evaluate_heuristic(board, player):
+    return board.score(player) + board.calculate_heuristic(player)
+
+
+# negamax search: the value of a board for one player is minus its value for the other player,
+# so a single function can search both the max and the min levels of a minimax tree.
+# depth counts single moves (plies).  a player with no moves passes, which doesn't use up depth
+# the engine is fail-soft: when a search is cut off, the value it returns is a bound past the alpha-beta
+# window, not just the window edge, which gives the transposition table tighter bounds to store
+class SearchEngine:
+    def __init__(
+        self,
+        evaluate=evaluate_score,
+        prune=True,
+        table=None,
+        budget=None,
+        ordering=None,
+        stats=None,
+    ):
+        self.evaluate = evaluate
+        # without pruning every child is searched with the full window, like plain minimax
+        self.prune = prune
+        self.table = table
+        self.budget = budget
+        self.ordering = ordering
+        self.stats = stats
+
+    # value of the board for player, searching depth plies ahead
+    def negamax(self, board, player, depth, alpha=-INFINITY, beta=INFINITY, ply=0):
+        stats = self.stats
+        if self.budget is not None:
+            self.budget.tick()
+        if stats is not None:
+            stats.visit(ply)
+        if depth <= 0:
+            if stats is not None:
+                stats.leaves += 1
+                stats.evaluations += 1
+            return self.evaluate(board, player)
+
+        original_alpha = alpha
+        best_move = None
+        if self.table is not None:
+            # seen this board before? reuse the stored value, or at least try its best move first
+            value, best_move = self.table.probe(board, player, depth, alpha, beta)
+            if value is not None:
+                if stats is not None:
+                    stats.table_hits += 1
+                return value
+
+        mask = board.move_mask(player)
+        if mask == 0:
+            # neither player can move, the game is over
+            if not board.has_any_move(-player):
+                if stats is not None:
+                    stats.evaluations += 1
+                return self.evaluate(board, player)
+            # the player has to pass, the opponent moves again from the same board
+            return -self.negamax(board, -player, depth, -beta, -alpha, ply + 1)
+
+        if self.ordering is not None:
+            moves = self.order(list(board.iter_moves(player, mask)), ply, best_move)
+        else:
+            # without move ordering statistics the moves come one at a time in square priority
+            # order, so after a cutoff the rest are never generated
+            moves = board.iter_moves(player, mask, best_move)
+        best_value = -INFINITY
+        for index, move in enumerate(moves):
+            undo = board.make_move(move[0], move[1], player)
+            if self.prune:
+                value = -self.negamax(board, -player, depth - 1, -beta, -alpha, ply + 1)
+            else:
+                value = -self.negamax(board, -player, depth - 1, ply=ply + 1)
+            board.unmake_move(undo)
+
+            if value > best_value:
+                best_value = value
+                best_move = move
+                if value > alpha:
+                    alpha = value
+                # the opponent already has a better option somewhere else, they'll never let us get here
+                if self.prune and alpha >= beta:
+                    if self.ordering is not None:
+                        self.ordering.record_cutoff(move, ply, depth)
+                    if stats is not None:
+                        stats.cutoff(index)
+                    break
+
+        if self.table is not None:
+            self.table.store(
+                board, player, depth, original_alpha, beta, best_value, best_move
+            )
+        return best_value
+
+    # searches each of the moves to depth plies (the move itself included).
+    # returns the best value and the list of the moves that get it
+    def best_moves(
+        self, original_board, player, moves, depth, alpha=-INFINITY, beta=INFINITY
+    ):
+        started = time.perf_counter()
+        # one board for the whole search, moves are made on it and taken back
+        board = original_board.copy()
+        if self.stats is not None:
+            self.stats.copies += 1
+            self.stats.visit(0)
+        original_alpha = alpha
+        table_move = None
+        if self.table is not None:
+            table_move = self.table.probe(board, player, depth, alpha, beta)[1]
+        moves = self.order(moves, 0, table_move)
+
+        best_value = -INFINITY
+        best_moves = []
+        for move in moves:
+            undo = board.make_move(move[0], move[1], player)
+            if self.prune:
+                window_alpha = max(alpha, best_value - TIE_MARGIN)
+                value = -self.negamax(
+                    board, -player, depth - 1, -beta, -window_alpha, 1
+                )
+            else:
+                value = -self.negamax(board, -player, depth - 1, ply=1)
+            board.unmake_move(undo)
+
+            if value > best_value:
+                best_value = value
+                best_moves = [move]
+            elif value == best_value:
+                best_moves.append(move)
+            if self.prune and best_value >= beta:
+                break
+
+        if self.table is not None and len(best_moves) > 0:
+            self.table.store(
+                board, player, depth, original_alpha, beta, best_value, best_moves[0]
+            )
+        if self.stats is not None:
+            self.stats.seconds += time.perf_counter() - started
+        return best_value, best_moves
+
+    # same as best_moves, but the moves are searched in parallel by a pool of worker processes.
+    # the first move (the most promising one) is searched here first, so the workers start with a good alpha.
+    # every worker shares the best value found so far, and reads it before starting on a move so its search
+    # can be cut by what the others found.  the workers keep their own transposition tables and move
+    # ordering, the budget only applies to the first move
+    def best_moves_parallel(
+        self,
+        original_board,
+        player,
+        moves,
+        depth,
+        workers,
+        alpha=-INFINITY,
+        beta=INFINITY,
+    ):
+        table_move = None
+        if self.table is not None:
+            table_move = self.table.probe(original_board, player, depth, alpha, beta)[1]
+        moves = self.order(moves, 0, table_move)
+        best_value, best_moves = self.best_moves(
+            original_board, player, moves[:1], depth, alpha, beta
+        )
+        if len(moves) == 1 or best_value >= beta:
+            return best_value, best_moves
+
+        pool, shared_alpha = get_parallel_pool(workers)
+        shared_alpha.value = max(alpha, best_value)
+        state = list(original_board.state)
+        futures = [
+            pool.submit(
+                search_root_move, state, player, move, depth, self.evaluate, beta
+            )
+            for move in moves[1:]
+        ]
+        for future in as_completed(futures):
+            move, value = future.result()
+            if value > best_value:
+                best_value = value
+                best_moves = [move]
+            elif value == best_value:
+                best_moves.append(move)
+        return best_value, best_moves
+
+    # move ordering: the table's best move first, then the order from the move ordering (if any)
+    def order(self, moves, ply, table_move=None):
+        if self.ordering is not None:
+            moves = self.ordering.order(moves, ply)
+        if table_move in moves:
+            moves = list(moves)
+            moves.remove(table_move)
+            moves.insert(0, table_move)
+        return moves
+
+
+# the endgame solver takes over from the depth limited searches once this few squares are empty
+ENDGAME_EMPTIES = 10
+
+# with more empty squares than this, the endgame solver orders moves fastest-first.  closer to the end
+# working out every reply costs more than the nodes it saves, so only the parity ordering is used
+FASTEST_FIRST_EMPTIES = 6
+
+# the four 5x5 quadrants of the board, as bitboards, for the parity move ordering
+QUADRANTS = []
+for _qx in range(2):
+    for _qy in range(2):
+        _quadrant = 0
+        for _x in range(5 * _qx, 5 * _qx + 5):
+            for _y in range(5 * _qy, 5 * _qy + 5):
+                _quadrant |= 1 << (_x + _y * 10)
+        QUADRANTS.append(_quadrant)
+
+
+# exact endgame solver: searches to the end of the game and scores the final board by its disc
+# difference, so its values are exact instead of estimates.  with wld (win/loss/draw) it only works
+# out whether the game is won, lost or drawn, which searches a window of (-1, 1) and cuts much more.
+# moves are ordered:
+#   - the transposition table's best move
+#   - fastest-first: moves that leave the opponent the fewest replies.  they tend to be the best
+#     moves, and they keep the tree narrow
+#   - parity: moves in a quadrant with an odd number of empty squares, so we get the last move there
+#   - the static square priority
+class EndgameSolver:
+    def __init__(self, table=None, budget=None, stats=None):
+        # values are disc differences, so the table can't be shared with the heuristic searches
+        self.table = table if table is not None else TranspositionTable(100000)
+        self.budget = budget
+        self.stats = stats
+
+    # exact final disc difference for player with both sides playing perfectly (or, with a window,
+    # a bound past it like SearchEngine.negamax)
+    def negamax(self, board, player, alpha=-INFINITY, beta=INFINITY, ply=0):
+        stats = self.stats
+        if self.budget is not None:
+            self.budget.tick()
+        if stats is not None:
+            stats.visit(ply)
+
+        # the number of empty squares is the depth left, so it is what the table stores
+        empties = board.empty_count
+        original_alpha = alpha
+        value, best_move = self.table.probe(board, player, empties, alpha, beta)
+        if value is not None:
+            if stats is not None:
+                stats.table_hits += 1
+            return value
+
+        moves = board.valid_moves(player)
+        if len(moves) == 0:
+            if not board.has_any_move(-player):
+                if stats is not None:
+                    stats.leaves += 1
+                return board.score(player)
+            return -self.negamax(board, -player, -beta, -alpha, ply + 1)
+
+        moves = self.order(board, player, moves, best_move)
+        best_value = -INFINITY
+        for index, move in enumerate(moves):
+            undo = board.make_move(move[0], move[1], player)
+            value = -self.negamax(board, -player, -beta, -alpha, ply + 1)
+            board.unmake_move(undo)
+
+            if value > best_value:
+                best_value = value
+                best_move = move
+                if value > alpha:
+                    alpha = value
+                if alpha >= beta:
+                    if stats is not None:
+                        stats.cutoff(index)
+                    break
+
+        self.table.store(
+            board, player, empties, original_alpha, beta, best_value, best_move
+        )
+        return best_value
+
+    def order(self, board, player, moves, table_move=None):
+        empty = ~(board.x_bits | board.o_bits) & FULL_MASK
+        odd = 0
+        for quadrant in QUADRANTS:
+            if popcount(empty & quadrant) % 2 == 1:
+                odd |= quadrant
+
+        if board.empty_count > FASTEST_FIRST_EMPTIES:
+
+            def key(move):
+                i = move[0] + move[1] * 10
+                undo = board.make_move(move[0], move[1], player)
+                replies = popcount(board.move_mask(-player))
+                board.unmake_move(undo)
+                return (-replies, (odd >> i) & 1, SQUARE_PRIORITY[i])
+
+        else:
+
+            def key(move):
+                i = move[0] + move[1] * 10
+                return ((odd >> i) & 1, SQUARE_PRIORITY[i])
+
+        moves = sorted(moves, key=key, reverse=True)
+        if table_move in moves:
+            moves.remove(table_move)
+            moves.insert(0, table_move)
+        return moves
+
+    # solves each of the moves.  returns the best value and the list of the moves that get it.
+    # with wld the values are 1 for a win, 0 for a draw and -1 for a loss
+    def best_moves(self, original_board, player, moves, wld=False):
+        started = time.perf_counter()
+        board = original_board.copy()
+        if self.stats is not None:
+            self.stats.copies += 1
+            self.stats.visit(0)
+
+        best_value = -INFINITY
+        best_moves = []
+        for move in self.order(board, player, moves):
+            undo = board.make_move(move[0], move[1], player)
+            if wld:
+                value = -self.negamax(board, -player, -1, 1, 1)
+                value = (value > 0) - (value < 0)
+            else:
+                # values are whole numbers, so searching just under the best value still
+                # gives ties their exact value
+                value = -self.negamax(board, -player, -INFINITY, 0.5 - best_value, 1)
+            board.unmake_move(undo)
+
+            if value > best_value:
+                best_value = value
+                best_moves = [move]
+            elif value == best_value:
+                best_moves.append(move)
+
+        if self.stats is not None:
+            self.stats.seconds += time.perf_counter() - started
+        return best_value, best_moves
+
+
+# solves the board for turn and picks one of the best moves randomly
+def get_endgame_move(original_board, turn, wld=False, budget=None, stats=None):
+    solver = EndgameSolver(budget=budget, stats=stats)
+    move_list = original_board.valid_moves(turn)
+    value, move_list = solver.best_moves(original_board, turn, move_list, wld)
+    return move_list[random.randrange(0, len(move_list))]
+
+
+# process pool for the parallel searches, created the first time it's needed and reused after that
+_parallel_pool = None
+_parallel_pool_workers = 0
+# the best value found so far by the running parallel search, shared with every worker process
+_parallel_alpha = None
+
+
+# returns the process pool and its shared alpha, making a new pool if the number of workers changed
+def get_parallel_pool(workers):
+    global _parallel_pool, _parallel_pool_workers, _parallel_alpha
+    if _parallel_pool is None or _parallel_pool_workers != workers:
+        if _parallel_pool is not None:
+            _parallel_pool.shutdown()
+        _parallel_alpha = multiprocessing.Value("d", -INFINITY)
+        _parallel_pool = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=init_parallel_worker,
+            initargs=(_parallel_alpha,),
+        )
+        _parallel_pool_workers = workers
+    return _parallel_pool, _parallel_alpha
+
+
+# what each worker process keeps between the moves it searches
+_worker_alpha = None
+# evaluation function -> (transposition table, move ordering)
+_worker_search_data = {}
+
+
+def init_parallel_worker(shared_alpha):
+    global _worker_alpha
+    _worker_alpha = shared_alpha
+
+
+# runs in a worker process: searches one move at the top of a parallel search.
+# returns the move with its value for player
+def search_root_move(state, player, move, depth, evaluate, beta):
+    if evaluate not in _worker_search_data:
+        _worker_search_data[evaluate] = (TranspositionTable(), MoveOrdering())
+    table, ordering = _worker_search_data[evaluate]
+    engine = SearchEngine(evaluate, True, table, None, ordering)
+
+    board = Board()
+    board.state = state
+    board.make_move(move[0], move[1], player)
+    # like best_moves, search just under the best value so ties still get their exact value
+    alpha = _worker_alpha.value - TIE_MARGIN
+    value = -engine.negamax(board, -player, depth - 1, -beta, -alpha, 1)
+
+    # let the other workers know about a better value
+    with _worker_alpha.get_lock():
+        if value > _worker_alpha.value:
+            _worker_alpha.value = value
+    return move, value
+
+
+# opening book: the best move for the positions of the first few plies, searched deeply ahead of time.
+# the file is a small header followed by one fixed size record per position, sorted by key:
+#   header: b"OBK1", number of records (uint32)
+#   record: position key (uint64), best move as a square index x + y * 10 (uint8), value (float32)
+# the key is the same as the transposition table's, so it covers the side to move.  the file is
+# memory mapped and searched with a binary search, so opening it doesn't read the whole file
+class OpeningBook:
+    MAGIC = b"OBK1"
+    HEADER = struct.Struct("<4sI")
+    RECORD = struct.Struct("<QBf")
+
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = self.HEADER.unpack_from(self.data, 0)
+        if magic != self.MAGIC:
+            self.data.close()
+            raise ValueError(f"{path} is not an opening book")
+
+    def __len__(self):
+        return self.count
+
+    # returns (move, value) for the board with turn to move, or None if it isn't in the book
+    def lookup(self, board, turn):
+        key = position_key(board, turn)
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            offset = self.HEADER.size + middle * self.RECORD.size
+            record_key, square, value = self.RECORD.unpack_from(self.data, offset)
+            if record_key < key:
+                low = middle + 1
+            elif record_key > key:
+                high = middle
+            else:
+                return (square % 10, square // 10), value
+        return None
+
+    def close(self):
+        self.data.close()
+
+    # writes a book file from a dict of key -> (move, value)
+    @classmethod
+    def write(cls, path, entries):
+        with open(path, "wb") as file:
+            file.write(cls.HEADER.pack(cls.MAGIC, len(entries)))
+            for key in sorted(entries):
+                (x, y), value = entries[key]
+                file.write(cls.RECORD.pack(key, x + y * 10, value))
+
+
+DEFAULT_OPENING_BOOK = os.path.join(os.path.dirname(__file__), "opening_book.bin")
+
+# the book the searches look at before searching, if one is loaded
+_opening_book = None
+
+
+# loads the book at path for the searches to use, or stops using a book if path is None
+def load_opening_book(path=DEFAULT_OPENING_BOOK):
+    global _opening_book
+    if _opening_book is not None:
+        _opening_book.close()
+        _opening_book = None
+    if path is not None:
+        _opening_book = OpeningBook(path)
+    return _opening_book
+
+
+# the book move for the board, or None when there is no book or the board isn't in it
+def get_book_move(board, turn, move_list=None):
+    if _opening_book is None:
+        return None
+    entry = _opening_book.lookup(board, turn)
+    if entry is None:
+        return None
+    # a hash collision could give a move that isn't valid here
+    if move_list is None:
+        move_list = board.valid_moves(turn)
+    if entry[0] not in move_list:
+        return None
+    return entry[0]
+
+
+# builds an opening book with the best move of every position in the first plies plies, each found
+# by a heuristic search depth rounds deep (2 * depth plies)
+def build_opening_book(path, plies=6, depth=3, verbose=False):
+    table = TranspositionTable()
+    ordering = MoveOrdering()
+    engine = SearchEngine(evaluate_heuristic, True, table, None, ordering)
+    entries = {}
+    positions = [(Board(), 1)]
+    for ply in range(plies):
+        next_positions = []
+        for board, turn in positions:
+            key = position_key(board, turn)
+            if key in entries:
+                continue
+            move_list = board.valid_moves(turn)
+            if len(move_list) == 0:
+                if board.move_mask(-turn) != 0:
+                    next_positions.append((board, -turn))
+                continue
+            value, best_moves = engine.best_moves(board, turn, move_list, 2 * depth)
+            # the first of the best moves, so the same book is built every time
+            entries[key] = (best_moves[0], value)
+            for move in move_list:
+                child = board.copy()
+                child.make_move(move[0], move[1], turn)
+                next_positions.append((child, -turn))
+        if verbose:
+            print(f"ply {ply}: {len(entries)} positions")
+        positions = next_positions
+    OpeningBook.write(path, entries)
+    return len(entries)
 
 
 # greedy player
 # one who goes for the win
 # if it can't win, play random
 # it should select a set of moves with the best score, and choose one randomly from it
-def get_greedy_move(original_board, move_list, turn):
+def get_greedy_move(original_board, move_list, turn, budget=None):
+    # one board for the whole search, moves are made on it and taken back
+    board = original_board.copy()
     # go through the moves and score them
     for i in range(len(move_list)):
-        board = original_board.copy()
-        board.place(move_list[i][0], move_list[i][1], turn)
+        move_undo = board.make_move(move_list[i][0], move_list[i][1], turn)
+        if budget is not None:
+            budget.tick()
         value = board.score(turn)
+        board.unmake_move(move_undo)
         # put the score as a tuple in front of the move
         move_list[i] = (value, move_list[i])
 
@@ -270,323 +1321,437 @@ def get_greedy_move(original_board, move_list, turn):
 # one depth minimax
 # look at all my moves, then all opponents
 #  behavior?  go for the win.  if no win, will block opponent
-def get_mini_max_move_one_depth(original_board, move_list, turn):
-    # go through all the moves to score them
-    for i in range(len(move_list)):
-        board = original_board.copy()
-        board.place(move_list[i][0], move_list[i][1], turn)
-        value = board.score(turn)
-        # end game? don't go further, use the score
-        if board.end():
-            move_list[i] = (value, move_list[i])
-        else:
-            # need to look at opponent
-            # get a list of all countermoves
-            countermoves = board.valid_moves(board.other_player(turn))
-            if len(countermoves) > 0:
-                # score them
-                for j in range(len(countermoves)):
-                    # put the score at front of move so I can sort
-                    new_board = board.copy()
-                    new_board.place(
-                        countermoves[j][0],
-                        countermoves[j][1],
-                        new_board.other_player(turn),
-                    )
-                    countermoves[j] = (
-                        new_board.score(turn),
-                        countermoves[j],
-                    )
-                # rank them: but this time with the min first
-                countermoves.sort(reverse=False, key=lambda x: x[0])
-                # get the score of the lowest move
-                worst_score = countermoves[0][0]
-                # now use that score to value my move
-                move_list[i] = (worst_score, move_list[i])
-
-    # now pick the best of the worst
-    move_list.sort(reverse=True, key=lambda x: x[0])
-    # get a sublist of all the moves that are best
-    index = 0
-    top_score = move_list[0][0]
-    while index < len(move_list) and move_list[index][0] == top_score:
-        index = index + 1
-    move_list = move_list[:index]
+def get_mini_max_move_one_depth(
+    original_board, move_list, turn, budget=None, stats=None
+):
+    book_move = get_book_move(original_board, turn, move_list)
+    if book_move is not None:
+        return book_move
+    engine = SearchEngine(evaluate_score, prune=False, budget=budget, stats=stats)
+    value, move_list = engine.best_moves(original_board, turn, move_list, 2)
     # moves now contains only my best moves (however many there are)
     # pick one randomly and return
-    move = move_list[random.randrange(0, len(move_list))]
-    return move[1]  # cut off the score and just return move
+    return move_list[random.randrange(0, len(move_list))]
 
 
 # n depth minimax
-# look at all my moves, then all opponents, then do recursive call to this same function
+# look at all my moves, then all opponents, and so on for depth rounds
+# a negative depth searches all the way to the end of the game
 def get_mini_max_move_n_depth(
-    original_board, move_list, turn, depth=-1, top_level=True
+    original_board,
+    move_list,
+    turn,
+    depth=-1,
+    top_level=True,
+    budget=None,
+    stats=None,
+    endgame_empties=ENDGAME_EMPTIES,
 ):
-    # go through all the moves to score them
-    for i in range(len(move_list)):
-        board = original_board.copy()
-        board.place(move_list[i][0], move_list[i][1], turn)
-        value = board.score(turn)
-        # end game? don't go further, use the score
-        if board.end():
-            move_list[i] = (value, move_list[i])
-        else:
-            # need to look at opponent
-            # get a list of all countermoves
-            countermoves = board.valid_moves(board.other_player(turn))
-            if len(countermoves) > 0:
-                # score them
-                for j in range(len(countermoves)):
-                    # put the score at front of move so I can sort
-                    new_board = board.copy()
-                    new_board.place(
-                        countermoves[j][0],
-                        countermoves[j][1],
-                        new_board.other_player(turn),
-                    )
-                    value = new_board.score(turn)
-                    if new_board.end():
-                        countermoves[j] = (value, countermoves[j])
-                    elif depth == 1:
-                        countermoves[j] = (value, countermoves[j])
-                    else:
-                        value = get_mini_max_move_n_depth(
-                            new_board,
-                            new_board.valid_moves(turn),
-                            turn,
-                            depth=depth - 1,
-                            top_level=False,
-                        )
-                        countermoves[j] = (value, countermoves[j])
-
-                # rank them: but this time with the min first
-                countermoves.sort(reverse=False, key=lambda x: x[0])
-                # get the score of the lowest move
-                worst_score = countermoves[0][0]
-                # now use that score to value my move
-                move_list[i] = (worst_score, move_list[i])
-                # print(
-                #     "X's move",
-                #     move_list[i][1],
-                #     "counter moves are",
-                #     [cm[1] for cm in countermoves],
-                # )
-
-    # now pick the best of the worst
-    move_list.sort(reverse=True, key=lambda x: x[0])
-
+    engine = SearchEngine(evaluate_score, prune=False, budget=budget, stats=stats)
+    plies = 2 * depth if depth >= 0 else original_board.empty_count
     if not top_level:
-        return move_list[0][0]
-
-    # get a sublist of all the moves that are best
-    index = 0
-    top_score = move_list[0][0]
-    while index < len(move_list) and move_list[index][0] == top_score:
-        index = index + 1
-    move_list = move_list[:index]
-
+        return engine.negamax(original_board.copy(), turn, plies)
+
+    book_move = get_book_move(original_board, turn, move_list)
+    if book_move is not None:
+        return book_move
+    if original_board.empty_count <= endgame_empties:
+        return get_endgame_move(original_board, turn, budget=budget, stats=stats)
+    value, move_list = engine.best_moves(original_board, turn, move_list, plies)
     # moves now contains only my best moves (however many there are)
     # pick one randomly and return
-    move = move_list[random.randrange(0, len(move_list))]
+    return move_list[random.randrange(0, len(move_list))]
+
+
+# searches with the engine and picks one of the best moves randomly, or returns the value of the
+# board for turn when it isn't the top level.  with more than one worker, the top level is searched
+# in parallel.  with endgame_empties or fewer empty squares the top level is solved exactly instead
+def search_with_engine(
+    engine,
+    original_board,
+    turn,
+    depth,
+    top_level,
+    alpha,
+    beta,
+    workers=None,
+    endgame_empties=ENDGAME_EMPTIES,
+):
+    plies = 2 * depth if depth >= 0 else original_board.empty_count
+    if not top_level:
+        if engine.stats is not None:
+            engine.stats.copies += 1
+        return engine.negamax(original_board.copy(), turn, plies, alpha, beta)
 
-    return move[1]  # cut off the score and just return move
+    move_list = original_board.valid_moves(turn)
+    book_move = get_book_move(original_board, turn, move_list)
+    if book_move is not None:
+        return book_move
+    if original_board.empty_count <= endgame_empties:
+        return get_endgame_move(
+            original_board, turn, budget=engine.budget, stats=engine.stats
+        )
+    if workers is not None and workers > 1:
+        value, move_list = engine.best_moves_parallel(
+            original_board, turn, move_list, plies, workers, alpha, beta
+        )
+    else:
+        value, move_list = engine.best_moves(
+            original_board, turn, move_list, plies, alpha, beta
+        )
+    # moves now contains only my best moves (however many there are)
+    # pick one randomly and return
+    return move_list[random.randrange(0, len(move_list))]
 
 
 # n depth minimax
 # this one includes pruning. This speeds up our results
 def get_mini_max_move_n_depth_pruning(
-    original_board, turn, depth=-1, top_level=True, alpha=-10000, beta=10000
+    original_board,
+    turn,
+    depth=-1,
+    top_level=True,
+    alpha=-INFINITY,
+    beta=INFINITY,
+    table=None,
+    budget=None,
+    ordering=None,
+    workers=None,
+    stats=None,
+    endgame_empties=ENDGAME_EMPTIES,
 ):
-    move_list = original_board.valid_moves(turn)
-    # go through all the moves to score them
-    for i in range(len(move_list)):
-        board = original_board.copy()
-        board.place(move_list[i][0], move_list[i][1], turn)
-        value = board.score(turn)
-        # end game? don't go further, use the score
-        if board.end():
-            move_list[i] = (value, move_list[i])
-        else:
-            alpha = max([alpha, value])
-
-            if beta <= alpha:
-                move_list[i] = (alpha, move_list[i])
-                break
-
-            # need to look at opponent
-            # get a list of all countermoves
-            countermoves = board.valid_moves(board.other_player(turn))
-            if len(countermoves) > 0:
-                # score them
-                for j in range(len(countermoves)):
-                    # put the score at front of move so I can sort
-                    new_board = board.copy()
-                    new_board.place(
-                        countermoves[j][0],
-                        countermoves[j][1],
-                        new_board.other_player(turn),
-                    )
-                    value = new_board.score(turn)
-                    if new_board.end():
-                        countermoves[j] = (value, countermoves[j])
-                    elif depth == 1:
-                        countermoves[j] = (value, countermoves[j])
-                    else:
-                        helper = len(new_board.valid_moves(turn))
-                        if helper > 0:
-                            value = get_mini_max_move_n_depth_pruning(
-                                new_board,
-                                turn,
-                                depth=depth - 1,
-                                top_level=False,
-                                alpha=alpha,
-                                beta=beta,
-                            )
-                            countermoves[j] = (value, countermoves[j])
-                        else:
-                            countermoves[j] = (value, countermoves[j])
-
-                    beta = min([beta, value])
-                    if beta <= alpha:
-                        move_list[i] = (beta, move_list[i])
-                        break
-
-                # rank them: but this time with the min first
-                countermoves.sort(reverse=False, key=lambda x: x[0])
-                # get the score of the lowest move
-                worst_score = countermoves[0][0]
-
-                # now use that score to value my move
-                if type(move_list[i][1]) == tuple:
-                    move_list[i] = (worst_score, move_list[i][1])
-                else:
-                    move_list[i] = (worst_score, move_list[i])
-            else:
-                move_list[i] = (value, move_list[i])
-
-    # now pick the best of the worst
-    move_list = [(m[0], m[1]) for m in move_list if (type(m[1]) == tuple)]
-
-    move_list.sort(reverse=True, key=lambda x: x[0])
-
-    if not top_level:
-        return move_list[0][0]
-
-    # get a sublist of all the moves that are best
-    index = 0
-    top_score = move_list[0][0]
-    while index < len(move_list) and move_list[index][0] == top_score:
-        index = index + 1
-    move_list = move_list[:index]
-
-    # moves now contains only my best moves (however many there are)
-    # pick one randomly and return
-    move = move_list[random.randrange(0, len(move_list))]
-
-    return move[1]  # cut off the score and just return move
+    engine = SearchEngine(evaluate_score, True, table, budget, ordering, stats)
+    return search_with_engine(
+        engine,
+        original_board,
+        turn,
+        depth,
+        top_level,
+        alpha,
+        beta,
+        workers,
+        endgame_empties,
+    )
 
 
 # n depth minimax
 # here, we actually implement an heuristic to improve our minimax algorithm
 def get_mini_max_move_n_depth_pruning_heuristic(
-    original_board, turn, depth=-1, top_level=True, alpha=-10000, beta=10000
+    original_board,
+    turn,
+    depth=-1,
+    top_level=True,
+    alpha=-INFINITY,
+    beta=INFINITY,
+    table=None,
+    budget=None,
+    ordering=None,
+    workers=None,
+    stats=None,
+    endgame_empties=ENDGAME_EMPTIES,
 ):
-    move_list = original_board.valid_moves(turn)
-    # go through all the moves to score them
-    for i in range(len(move_list)):
-        board = original_board.copy()
-        board.place(move_list[i][0], move_list[i][1], turn)
-        value = board.score(turn)
-        # end game? don't go further, use the score
-        if board.end():
-            heuristic = board.calculate_heuristic(turn)
-            move_list[i] = (value + heuristic, move_list[i])
-        else:
-            alpha = max([alpha, value])
-
-            if beta <= alpha:
-                heuristic = board.calculate_heuristic(turn)
-                move_list[i] = (alpha + heuristic, move_list[i])
+    engine = SearchEngine(evaluate_heuristic, True, table, budget, ordering, stats)
+    return search_with_engine(
+        engine,
+        original_board,
+        turn,
+        depth,
+        top_level,
+        alpha,
+        beta,
+        workers,
+        endgame_empties,
+    )
+
+
+# iterative deepening
+# searches depth 1, 2, 3... until the time or node budget runs out, and plays the best move of the last
+# search that finished.  every search stores its boards in the transposition table, so the next one tries
+# the best moves it found first and gets much more pruning
+def get_mini_max_move_iterative_deepening(
+    original_board,
+    turn,
+    time_limit=1.0,
+    node_limit=None,
+    max_depth=50,
+    heuristic=True,
+    table=None,
+    ordering=None,
+    stats=None,
+    endgame_empties=ENDGAME_EMPTIES,
+    stop=None,
+):
+    book_move = get_book_move(original_board, turn)
+    if book_move is not None:
+        return book_move
+    budget = SearchBudget(time_limit, node_limit, stop)
+    # the solver shares the budget.  if it can't finish in time, fall back to the normal search
+    if original_board.empty_count <= endgame_empties:
+        try:
+            return get_endgame_move(original_board, turn, budget=budget, stats=stats)
+        except SearchTimeout:
+            pass
+    if heuristic:
+        search = get_mini_max_move_n_depth_pruning_heuristic
+    else:
+        search = get_mini_max_move_n_depth_pruning
+    if table is None:
+        table = TranspositionTable()
+    if ordering is None:
+        ordering = MoveOrdering()
+    ordering.age()
+
+    # depth 1 always runs to the end, so there is a move to play even with a tiny budget
+    started = time.perf_counter()
+    # the solver was already tried above, the depth limited searches mustn't run it again without the budget
+    move = search(
+        original_board,
+        turn,
+        1,
+        table=table,
+        ordering=ordering,
+        stats=stats,
+        endgame_empties=0,
+    )
+    if stats is not None:
+        stats.seconds_per_depth[1] = time.perf_counter() - started
+    for depth in range(2, max_depth + 1):
+        # each depth adds two moves.  once that covers every empty square, deeper searches see nothing new
+        if 2 * (depth - 1) >= original_board.empty_count:
+            break
+        started = time.perf_counter()
+        try:
+            move = search(
+                original_board,
+                turn,
+                depth,
+                table=table,
+                budget=budget,
+                ordering=ordering,
+                stats=stats,
+                endgame_empties=0,
+            )
+        except SearchTimeout:
+            break
+        if stats is not None:
+            stats.seconds_per_depth[depth] = time.perf_counter() - started
+        # the next depth takes longer than this one did, don't start it if it can't finish
+        remaining = budget.remaining()
+        if remaining is not None and remaining < time.perf_counter() - started:
+            break
+    return move
+
+
+# the four corners as a bitboard.  the playouts take a corner whenever they can
+CORNERS_MASK = (1 << 0) | (1 << 9) | (1 << 90) | (1 << 99)
+
+
+# plays random moves from the board until the game ends, and returns the winner (1, -1, or 0 for a
+# draw).  the board is played on, so pass a copy.  moves are picked at random, except that a corner
+# is always taken.  that keeps the playouts almost as fast as pure random ones but a lot less silly
+def random_playout(board, turn):
+    while True:
+        mask = board.move_mask(turn)
+        if mask == 0:
+            if not board.has_any_move(-turn):
                 break
-
-            # need to look at opponent
-            # get a list of all countermoves
-            countermoves = board.valid_moves(board.other_player(turn))
-            if len(countermoves) > 0:
-                # score them
-                for j in range(len(countermoves)):
-                    # put the score at front of move so I can sort
-                    new_board = board.copy()
-                    new_board.place(
-                        countermoves[j][0],
-                        countermoves[j][1],
-                        new_board.other_player(turn),
-                    )
-                    value = new_board.score(turn)
-                    if new_board.end():
-                        heuristic = new_board.calculate_heuristic(turn)
-                        countermoves[j] = (value + heuristic, countermoves[j])
-                    elif depth == 1:
-                        heuristic = new_board.calculate_heuristic(turn)
-                        countermoves[j] = (value + heuristic, countermoves[j])
-                    else:
-                        helper = len(new_board.valid_moves(turn))
-                        if helper > 0:
-                            value = get_mini_max_move_n_depth_pruning_heuristic(
-                                new_board,
-                                turn,
-                                depth=depth - 1,
-                                top_level=False,
-                                alpha=alpha,
-                                beta=beta,
-                            )
-                            heuristic = new_board.calculate_heuristic(turn)
-                            countermoves[j] = (value + heuristic, countermoves[j])
-                        else:
-                            heuristic = new_board.calculate_heuristic(turn)
-                            countermoves[j] = (value + heuristic, countermoves[j])
-
-                    beta = min([beta, value])
-                    if beta <= alpha:
-                        heuristic = new_board.calculate_heuristic(turn)
-                        move_list[i] = (beta + heuristic, move_list[i])
-                        break
-
-                # rank them: but this time with the min first
-                countermoves.sort(reverse=False, key=lambda x: x[0])
-                # get the score of the lowest move
-                worst_score = countermoves[0][0]
-
-                # now use that score to value my move
-                if type(move_list[i][1]) == tuple:
-                    move_list[i] = (worst_score, move_list[i][1])
-                else:
-                    move_list[i] = (worst_score, move_list[i])
-            else:
-                heuristic = board.calculate_heuristic(turn)
-                move_list[i] = (value + heuristic, move_list[i])
-
-    # now pick the best of the worst
-    move_list = [(m[0], m[1]) for m in move_list if (type(m[1]) == tuple)]
-
-    move_list.sort(reverse=True, key=lambda x: x[0])
-
-    if not top_level:
-        return move_list[0][0]
-
-    # get a sublist of all the moves that are best
-    index = 0
-    top_score = move_list[0][0]
-    while index < len(move_list) and move_list[index][0] == top_score:
-        index = index + 1
-    move_list = move_list[:index]
-
-    # moves now contains only my best moves (however many there are)
-    # pick one randomly and return
-    move = move_list[random.randrange(0, len(move_list))]
-
-    return move[1]  # cut off the score and just return move
+            turn = -turn
+            continue
+        if mask & CORNERS_MASK:
+            mask &= CORNERS_MASK
+        # drop a random number of the lowest moves, then play the lowest one left
+        for _ in range(random.randrange(popcount(mask))):
+            mask &= mask - 1
+        i = (mask & -mask).bit_length() - 1
+        board.make_move(i % 10, i // 10, turn)
+        turn = -turn
+    score = board.score(1)
+    return (score > 0) - (score < 0)
+
+
+# one board in the monte carlo search tree.  the board itself isn't stored, it is rebuilt by playing
+# the moves down from the root
+class MCTSNode:
+    __slots__ = (
+        "move",
+        "player",
+        "turn",
+        "key",
+        "parent",
+        "children",
+        "untried",
+        "visits",
+        "wins",
+    )
+
+    def __init__(self, board, turn, move=None, player=None, parent=None):
+        # the move that led here (None for a pass or the root) and the player who made it
+        self.move = move
+        self.player = player
+        # the player to move on this board, and the board's key, to find it again on the next turn
+        self.turn = turn
+        self.key = board.key()
+        self.parent = parent
+        self.children = []
+        # moves without a child yet.  a player without moves passes, unless the game is over
+        self.untried = board.valid_moves(turn)
+        if len(self.untried) == 0 and board.has_any_move(-turn):
+            self.untried = [None]
+        self.visits = 0
+        # playouts won by player, draws count as half a win
+        self.wins = 0.0
+
+
+# monte carlo tree search with UCT: grows a tree of moves, choosing which move to look at with the
+# upper confidence bound (the win rate plus a bonus for moves tried less often), and scores each new
+# board with a random playout.  it gets better the more playouts it has time for, instead of costing
+# exponentially more for each extra move of depth like minimax.
+# keep one MCTS per game: the part of the tree under the moves that were played is reused on the
+# next turn
+class MCTS:
+    def __init__(self, exploration=1.4):
+        self.exploration = exploration
+        self.root = None
+
+    # finds the board in the tree kept from the last search (a couple of moves down from its root),
+    # or starts a new tree
+    def find_root(self, board, turn):
+        key = board.key()
+        nodes = [] if self.root is None else [self.root]
+        for _ in range(4):
+            for node in nodes:
+                if node.key == key and node.turn == turn:
+                    node.parent = None
+                    return node
+            nodes = [child for node in nodes for child in node.children]
+        return MCTSNode(board, turn)
+
+    # plays playouts from board until the budget runs out, and returns the most visited move
+    def search(self, original_board, turn, budget):
+        self.root = self.find_root(original_board, turn)
+        try:
+            while True:
+                budget.tick()
+                self.playout(original_board.copy())
+        except SearchTimeout:
+            pass
+
+        if len(self.root.children) == 0:
+            return random.choice(original_board.valid_moves(turn))
+        return max(self.root.children, key=lambda child: child.visits).move
+
+    # one round of the search: walk down the tree, add a node, play it out and record the result
+    def playout(self, board):
+        node = self.root
+        # selection: follow the best child until a node still has untried moves
+        while len(node.untried) == 0 and len(node.children) > 0:
+            node = self.select(node)
+            if node.move is not None:
+                board.make_move(node.move[0], node.move[1], node.player)
+
+        # expansion
+        if len(node.untried) > 0:
+            move = node.untried.pop(random.randrange(len(node.untried)))
+            if move is not None:
+                board.make_move(move[0], move[1], node.turn)
+            child = MCTSNode(board, -node.turn, move, node.turn, node)
+            node.children.append(child)
+            node = child
+
+        # simulation and backpropagation
+        winner = random_playout(board, node.turn)
+        while node is not None:
+            node.visits += 1
+            if winner == node.player:
+                node.wins += 1
+            elif winner == 0:
+                node.wins += 0.5
+            node = node.parent
+
+    # the child with the highest upper confidence bound
+    def select(self, node):
+        log_visits = math.log(node.visits)
+        exploration = self.exploration
+        return max(
+            node.children,
+            key=lambda child: child.wins / child.visits
+            + exploration * math.sqrt(log_visits / child.visits),
+        )
+
+
+# monte carlo tree search player.  it plays playouts for time_limit seconds, or playouts of them
+# if that is given.  one of the two is needed, the search never ends without a limit.  pass the same
+# mcts every turn of a game to reuse its tree
+def get_mcts_move(original_board, turn, time_limit=1.0, playouts=None, mcts=None):
+    if time_limit is None and playouts is None:
+        raise ValueError(
+            "the monte carlo search needs a time limit or a number of playouts"
+        )
+    if mcts is None:
+        mcts = MCTS()
+    if playouts is not None:
+        time_limit = None
+    return mcts.search(original_board, turn, SearchBudget(time_limit, playouts))
+
+
+# pondering: thinking about our next move while the opponent is thinking about theirs (or while the
+# game waits for a key press).  after our move, a background thread goes through the opponent's
+# replies, most likely first (by square priority), and searches our answer to each one.  when the
+# opponent has moved, take() stops the thread and gives back the answer if that reply was searched.
+# it is a thread and not a process so it can fill the game's transposition table, which helps the
+# next search even when the reply wasn't reached.  the GIL means it only really gains time while
+# the main thread is waiting, like for input()
+class Ponderer:
+    # search(board, turn, budget) returns the move for turn.  it has to stop with SearchTimeout
+    # when the budget says so
+    def __init__(self, search):
+        self.search = search
+        self.thread = None
+        self.stop_event = None
+        # (key of the board after a reply, player to move) -> our move
+        self.results = {}
+
+    # starts pondering on the board, where opponent moves next
+    def start(self, board, opponent):
+        self.stop()
+        self.results = {}
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(
+            target=self.run,
+            args=(board.copy(), opponent, self.stop_event, self.results),
+            daemon=True,
+        )
+        self.thread.start()
+
+    def run(self, board, opponent, stop_event, results):
+        player = -opponent
+        for reply in board.iter_moves(opponent):
+            undo = board.make_move(reply[0], reply[1], opponent)
+            position = board.copy()
+            board.unmake_move(undo)
+            if not position.has_any_move(player):
+                continue
+            try:
+                move = self.search(position, player, SearchBudget(stop=stop_event))
+            except SearchTimeout:
+                return
+            # a search that handles its own timeouts (like iterative deepening) returns when stopped,
+            # with a move that may not be as good as the search would find.  don't keep it
+            if stop_event.is_set():
+                return
+            results[(position.key(), player)] = move
+
+    # stops pondering and waits for the thread to finish
+    def stop(self):
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+
+    # stops pondering, and returns the pondered move for turn on the board (None if it wasn't reached)
+    def take(self, board, turn):
+        self.stop()
+        return self.results.get((board.key(), turn))
 
 
 # gets the move from a human player via keyboard input
@@ -613,7 +1778,8 @@ def game_type_selection():
     print("2 - Greedy")
     print("3 - Minimax 1 Depth (no optimizations)")
     print("4 - Minimax N Depth (you can select optimizations)")
-    print("5 - Exit program\n")
+    print("5 - Monte Carlo Tree Search (you choose the time per move)")
+    print("6 - Exit program\n")
     print("*********************************************************\n")
 
     choice = int(input("Choose a way to plan the game >> "))
@@ -628,6 +1794,8 @@ def game_type_selection():
         return GameType.MINIMAX_1DEPTH
     elif choice == GameType.MINIMAX_NDEPTH.value:
         return GameType.MINIMAX_NDEPTH
+    elif choice == GameType.MCTS.value:
+        return GameType.MCTS
     else:
         return GameType.EXIT_GAME
 
@@ -636,7 +1804,19 @@ def game_type_selection():
 def optimizations_selection():
     print("\n*********************************************************\n")
     print("0 - Alpha Beta Pruning of Minimax Tree")
-    print("1 - Alpha Beta Pruning of Minimax Tree + Heuristics\n")
+    print("1 - Alpha Beta Pruning of Minimax Tree + Heuristics")
+    print(
+        "4 - Alpha Beta Pruning of Minimax Tree + Heuristics"
+        " + Pruning of Previously Seen Board States"
+    )
+    print(
+        "5 - Iterative Deepening with a Time Limit per Move"
+        " (the depth becomes the maximum depth)"
+    )
+    print(
+        "6 - Alpha Beta Pruning of Minimax Tree + Heuristics"
+        " + Pruning of Previously Seen Board States, in Parallel on Every CPU Core\n"
+    )
     print("*********************************************************\n")
 
     choice = int(input("Choose an optimization >> "))
@@ -645,12 +1825,27 @@ def optimizations_selection():
         return Optimization.ALPHA_BETA
     elif choice == Optimization.HEURISTIC.value:
         return Optimization.HEURISTIC
+    elif choice == Optimization.PRUNING.value:
+        return Optimization.PRUNING
+    elif choice == Optimization.ITERATIVE_DEEPENING.value:
+        return Optimization.ITERATIVE_DEEPENING
+    elif choice == Optimization.PARALLEL.value:
+        return Optimization.PARALLEL
     else:
         exit(0)
 
 
 # the actual game
-def run_game():
+# show_stats prints what the computer's search did after each of its moves, and stats_file appends it
+# to that file as one JSON line per move.  the minimax players play from the opening book at book
+# when the file exists.  with ponder, the pruning and iterative deepening players search their
+# answers to the opponent's replies while the game waits for a key press
+def run_game(
+    show_stats=False, stats_file=None, book=DEFAULT_OPENING_BOOK, ponder=False
+):
+
+    if book is not None and os.path.exists(book):
+        load_opening_book(book)
 
     game_type = game_type_selection()
 
@@ -658,12 +1853,51 @@ def run_game():
 
         optimization = ""
         depth = 1
+        time_limit = None
 
         if game_type == GameType.MINIMAX_NDEPTH:
 
             depth = int(input("\n\nEnter the minimax depth >> "))
             optimization = optimizations_selection()
 
+            if optimization == Optimization.ITERATIVE_DEEPENING:
+                time_limit = float(
+                    input("\nEnter the time limit per move (seconds) >> ")
+                )
+
+        if game_type == GameType.MCTS:
+            time_limit = float(input("\n\nEnter the time limit per move (seconds) >> "))
+
+        # boards seen by the searches and the move ordering statistics, shared between both players
+        # and kept for the whole game
+        table = TranspositionTable()
+        ordering = MoveOrdering()
+        # the monte carlo search tree, reused from one move to the next
+        mcts = MCTS()
+
+        ponderers = None
+        if ponder and optimization in [
+            Optimization.PRUNING,
+            Optimization.ITERATIVE_DEEPENING,
+        ]:
+
+            def ponder_search(board, turn, budget):
+                if optimization == Optimization.ITERATIVE_DEEPENING:
+                    return get_mini_max_move_iterative_deepening(
+                        board,
+                        turn,
+                        time_limit,
+                        max_depth=depth,
+                        table=table,
+                        ordering=ordering,
+                        stop=budget.stop,
+                    )
+                return get_mini_max_move_n_depth_pruning_heuristic(
+                    board, turn, depth, table=table, budget=budget, ordering=ordering
+                )
+
+            ponderers = {1: Ponderer(ponder_search), -1: Ponderer(ponder_search)}
+
         # make the starting board
         board = Board()
 
@@ -678,29 +1912,75 @@ def run_game():
                 continue
 
             move = random.choice(move_list)
+            stats = SearchStats()
+            pondered = None
+            if ponderers is not None:
+                pondered = ponderers[turn].take(board, turn)
 
             # select an algorithm, defaults to random
-            if turn == 1:
+            if pondered is not None:
+                move = pondered
+                if show_stats:
+                    print("\nmove found while pondering")
+            elif turn == 1:
                 if game_type == GameType.MANUAL:
                     # move = random.choice(move_list)
                     # move = get_greedy_move(board, move_list, turn)
                     # move = get_mini_max_move_one_depth(board, move_list, turn)
                     # move = get_mini_max_move_n_depth(board, move_list, turn, 2)
-                    move = get_mini_max_move_n_depth_pruning(board, turn, 2)
+                    move = get_mini_max_move_n_depth_pruning(
+                        board, turn, 2, stats=stats
+                    )
                     # move = get_mini_max_move_n_depth_pruning_heuristic(board, turn, 3)
                 elif game_type == GameType.RANDOM:
                     move = random.choice(move_list)
                 elif game_type == GameType.GREEDY:
                     move = get_greedy_move(board, move_list, turn)
                 elif game_type == GameType.MINIMAX_1DEPTH:
-                    move = get_mini_max_move_one_depth(board, move_list, turn)
+                    move = get_mini_max_move_one_depth(
+                        board, move_list, turn, stats=stats
+                    )
                 elif game_type == GameType.MINIMAX_NDEPTH:
                     if optimization == Optimization.ALPHA_BETA:
-                        move = get_mini_max_move_n_depth_pruning(board, turn, depth)
+                        move = get_mini_max_move_n_depth_pruning(
+                            board, turn, depth, stats=stats
+                        )
                     elif optimization == Optimization.HEURISTIC:
                         move = get_mini_max_move_n_depth_pruning_heuristic(
-                            board, turn, depth
+                            board, turn, depth, stats=stats
+                        )
+                    elif optimization == Optimization.PRUNING:
+                        move = get_mini_max_move_n_depth_pruning_heuristic(
+                            board,
+                            turn,
+                            depth,
+                            table=table,
+                            ordering=ordering,
+                            stats=stats,
+                        )
+                    elif optimization == Optimization.ITERATIVE_DEEPENING:
+                        move = get_mini_max_move_iterative_deepening(
+                            board,
+                            turn,
+                            time_limit,
+                            max_depth=depth,
+                            table=table,
+                            ordering=ordering,
+                            stats=stats,
+                        )
+                    elif optimization == Optimization.PARALLEL:
+                        move = get_mini_max_move_n_depth_pruning_heuristic(
+                            board,
+                            turn,
+                            depth,
+                            table=table,
+                            ordering=ordering,
+                            workers=os.cpu_count(),
+                            # only the first move counts, the worker processes don't count anything
+                            stats=stats,
                         )
+                elif game_type == GameType.MCTS:
+                    move = get_mcts_move(board, turn, time_limit, mcts=mcts)
                 else:
                     move = random.choice(move_list)
             else:
@@ -711,20 +1991,58 @@ def run_game():
                     # move = get_mini_max_move_n_depth(board, move_list, turn, 2)
                     # move = get_human_move(move_list)
                     # move = get_mini_max_move_n_depth_pruning(board, turn, 2)
-                    move = get_mini_max_move_n_depth_pruning_heuristic(board, turn, 2)
+                    move = get_mini_max_move_n_depth_pruning_heuristic(
+                        board, turn, 2, stats=stats
+                    )
                 elif game_type == GameType.RANDOM:
                     move = random.choice(move_list)
                 elif game_type == GameType.GREEDY:
                     move = get_greedy_move(board, move_list, turn)
                 elif game_type == GameType.MINIMAX_1DEPTH:
-                    move = get_mini_max_move_one_depth(board, move_list, turn)
+                    move = get_mini_max_move_one_depth(
+                        board, move_list, turn, stats=stats
+                    )
                 elif game_type == GameType.MINIMAX_NDEPTH:
                     if optimization == Optimization.ALPHA_BETA:
-                        move = get_mini_max_move_n_depth_pruning(board, turn, depth)
+                        move = get_mini_max_move_n_depth_pruning(
+                            board, turn, depth, stats=stats
+                        )
                     elif optimization == Optimization.HEURISTIC:
                         move = get_mini_max_move_n_depth_pruning_heuristic(
-                            board, turn, depth
+                            board, turn, depth, stats=stats
+                        )
+                    elif optimization == Optimization.PRUNING:
+                        move = get_mini_max_move_n_depth_pruning_heuristic(
+                            board,
+                            turn,
+                            depth,
+                            table=table,
+                            ordering=ordering,
+                            stats=stats,
+                        )
+                    elif optimization == Optimization.ITERATIVE_DEEPENING:
+                        move = get_mini_max_move_iterative_deepening(
+                            board,
+                            turn,
+                            time_limit,
+                            max_depth=depth,
+                            table=table,
+                            ordering=ordering,
+                            stats=stats,
+                        )
+                    elif optimization == Optimization.PARALLEL:
+                        move = get_mini_max_move_n_depth_pruning_heuristic(
+                            board,
+                            turn,
+                            depth,
+                            table=table,
+                            ordering=ordering,
+                            workers=os.cpu_count(),
+                            # only the first move counts, the worker processes don't count anything
+                            stats=stats,
                         )
+                elif game_type == GameType.MCTS:
+                    move = get_mcts_move(board, turn, time_limit, mcts=mcts)
                 else:
                     move = random.choice(move_list)
 
@@ -733,9 +2051,20 @@ def run_game():
             # make the move
             board.place(move[0], move[1], turn)
 
+            # think about the next move while waiting for the key press below
+            if ponderers is not None:
+                ponderers[turn].start(board, -turn)
+
             # print whose turn it is
             print("\nTurn:", "X" if turn == 1 else "O")
 
+            if stats.nodes > 0:
+                if show_stats:
+                    print(stats.report())
+                if stats_file is not None:
+                    with open(stats_file, "a") as file:
+                        file.write(json.dumps({"turn": turn, **stats.to_dict()}) + "\n")
+
             # swap players
             turn = -turn
             # print
@@ -746,11 +2075,317 @@ def run_game():
             # wait for user to press a key
             input()
 
+            # pondering only runs while waiting for the key.  a thread pondering during the next
+            # search would take half of its time, since the searches share the GIL
+            if ponderers is not None:
+                ponderers[-turn].stop()
+
+        if ponderers is not None:
+            for ponderer in ponderers.values():
+                ponderer.stop()
+
         score_x = board.calculate_score(1)
         score_o = board.calculate_score(-1)
         print("X score is", score_x)
         print("O score is", score_o)
 
 
+# positions for perft, as the moves played from the starting board.  each move is written as its x and y
+# digits, so "46" is x=4, y=6.  a player without moves passes, so the moves alternate between players
+# except after a pass
+PERFT_POSITIONS = {
+    "start": "",
+    "opening": "46 56 63 35 24 72 65 76",
+    "midgame": (
+        "35 34 23 36 37 27 53 38 18 33 47 13 32 43 52 41 49 65 75 46 "
+        "03 09 31 57 51 62 68 76 26 74 28 22 21 10 20 42 24 14 63 67"
+    ),
+    "endgame": (
+        "46 56 67 34 53 78 36 66 24 37 38 52 89 33 76 27 26 49 51 64 "
+        "42 35 39 23 73 22 43 50 11 74 65 15 17 82 62 00 59 28 32 48 "
+        "60 72 63 40 85 68 14 70 13 03 16 94 47 18 58 88 87 98 25 84 "
+        "71 61 83 80 81 92 57 69 29 19 21 41 07 20 75 86 06 05 90 91 "
+        "10 31 04 08"
+    ),
+}
+
+
+# plays a list of moves from the starting board, passing for whoever can't move.  moves are either
+# x,y tuples or a string like the ones in PERFT_POSITIONS.  returns the board and the player to move next
+def board_from_moves(moves):
+    if isinstance(moves, str):
+        moves = [(int(move[0]), int(move[1])) for move in moves.split()]
+    board = Board()
+    turn = 1
+    for move in moves:
+        if board.move_mask(turn) == 0:
+            turn = -turn
+        if board.make_move(move[0], move[1], turn) is None:
+            raise ValueError(f"{move} is not a valid move")
+        turn = -turn
+    # no moves, skip the turn
+    if board.move_mask(turn) == 0 and not board.end():
+        turn = -turn
+    return board, turn
+
+
+# perft: counts the boards reached after depth moves, to check the move generator and measure its speed.
+# passes work like in run_game: a player without moves is skipped without using up depth,
+# and a finished game counts as one board even if it ends before depth
+def perft(board, turn, depth):
+    if depth == 0:
+        return 1
+    moves = board.valid_moves(turn)
+    if len(moves) == 0:
+        if board.move_mask(-turn) == 0:
+            return 1
+        return perft(board, -turn, depth)
+    # every move leads to exactly one board at the last level, no need to make them
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        undo = board.make_move(move[0], move[1], turn)
+        nodes += perft(board, -turn, depth - 1)
+        board.unmake_move(undo)
+    return nodes
+
+
+# runs perft on a stored position for every depth up to depth, printing the counts and the speed
+def perft_report(position, depth):
+    board, turn = board_from_moves(PERFT_POSITIONS[position])
+    print(f"perft {position}, {'X' if turn == 1 else 'O'} to move")
+    for d in range(1, depth + 1):
+        started = time.perf_counter()
+        nodes = perft(board, turn, d)
+        seconds = time.perf_counter() - started
+        print(
+            f"depth {d}: {nodes} nodes in {seconds:.3f}s"
+            f" ({nodes / max(seconds, 1e-9):.0f} nodes/s)"
+        )
+
+
+# agents that can play headless games, for tournaments
+AGENTS = ["random", "greedy", "minimax1", "ndepth", "pruning", "heuristic", "mcts"]
+
+
+# gets the move of one of the AGENTS.  depth is only used by the n depth searches, for mcts it is
+# the number of playouts per move.  mcts is the MCTS whose tree is reused, if any
+def get_agent_move(agent, board, move_list, turn, depth, mcts=None):
+    if agent == "random":
+        return random.choice(move_list)
+    elif agent == "greedy":
+        return get_greedy_move(board, move_list, turn)
+    elif agent == "minimax1":
+        return get_mini_max_move_one_depth(board, move_list, turn)
+    elif agent == "ndepth":
+        return get_mini_max_move_n_depth(board, move_list, turn, depth)
+    elif agent == "pruning":
+        return get_mini_max_move_n_depth_pruning(board, turn, depth)
+    elif agent == "heuristic":
+        return get_mini_max_move_n_depth_pruning_heuristic(board, turn, depth)
+    elif agent == "mcts":
+        return get_mcts_move(board, turn, playouts=depth, mcts=mcts)
+    raise ValueError(f"unknown agent {agent}")
+
+
+# plays one game without printing or waiting for input.  agent_x plays 1 (X), agent_o plays -1 (O),
+# each agent is a (name, depth) pair.  the seed makes the random choices of the agents repeatable
+def play_game(agent_x, agent_o, seed):
+    random.seed(seed)
+    agents = {1: agent_x, -1: agent_o}
+    # per player: number of moves and seconds spent choosing them
+    moves = {1: 0, -1: 0}
+    seconds = {1: 0.0, -1: 0.0}
+    # each player keeps its own search tree for the whole game
+    trees = {1: MCTS(), -1: MCTS()}
+
+    board = Board()
+    turn = 1
+    while not board.end():
+        move_list = board.valid_moves(turn)
+        # no moves, skip the turn
+        if len(move_list) == 0:
+            turn = -turn
+            continue
+
+        name, depth = agents[turn]
+        started = time.perf_counter()
+        move = get_agent_move(name, board, move_list, turn, depth, trees[turn])
+        seconds[turn] += time.perf_counter() - started
+        moves[turn] += 1
+
+        board.place(move[0], move[1], turn)
+        turn = -turn
+
+    return {
+        "score_x": board.calculate_score(1),
+        "score_o": board.calculate_score(-1),
+        "moves": moves,
+        "seconds": seconds,
+    }
+
+
+# plays games between two agents on a process pool.  the agents swap colors every game.
+# returns the results from the point of view of agent_a
+def run_tournament(agent_a, agent_b, games, seed=0, workers=None):
+    if games < 1:
+        raise ValueError("a tournament needs at least one game")
+    pairings = []
+    for game in range(games):
+        if game % 2 == 0:
+            pairings.append((agent_a, agent_b, seed + game))
+        else:
+            pairings.append((agent_b, agent_a, seed + game))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(play_game, *zip(*pairings)))
+
+    summary = {"wins": 0, "losses": 0, "draws": 0, "margin": 0}
+    moves = {"a": 0, "b": 0}
+    seconds = {"a": 0.0, "b": 0.0}
+    for game, result in enumerate(results):
+        # which color agent_a played
+        color_a = 1 if game % 2 == 0 else -1
+        margin = result["score_x"] - result["score_o"]
+        if color_a == -1:
+            margin = -margin
+        if margin > 0:
+            summary["wins"] += 1
+        elif margin < 0:
+            summary["losses"] += 1
+        else:
+            summary["draws"] += 1
+        summary["margin"] += margin
+        moves["a"] += result["moves"][color_a]
+        moves["b"] += result["moves"][-color_a]
+        seconds["a"] += result["seconds"][color_a]
+        seconds["b"] += result["seconds"][-color_a]
+
+    summary["margin"] /= games
+    summary["seconds_per_move_a"] = seconds["a"] / max(moves["a"], 1)
+    summary["seconds_per_move_b"] = seconds["b"] / max(moves["b"], 1)
+    return summary
+
+
+# parses an agent given as name or name:depth.  the depth defaults to 2, and the playouts of mcts to 200
+def parse_agent(text):
+    name, _, depth = text.partition(":")
+    if name not in AGENTS:
+        raise argparse.ArgumentTypeError(
+            f"unknown agent {name}, choose from {', '.join(AGENTS)}"
+        )
+    if depth:
+        return name, positive_int(depth)
+    return name, 200 if name == "mcts" else 2
+
+
+# argparse type for counts that must be at least 1
+def positive_int(text):
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not a positive number")
+    return value
+
+
+# name of a (name, depth) agent for printing, with the depth if the agent uses it
+def agent_name(agent):
+    name, depth = agent
+    if name in ["ndepth", "pruning", "heuristic", "mcts"]:
+        return f"{name}:{depth}"
+    return name
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Othello with minimax players")
+    commands = parser.add_subparsers(dest="command")
+
+    tournament = commands.add_parser(
+        "tournament", help="play games between two agents without any input"
+    )
+    tournament.add_argument(
+        "agent_a",
+        type=parse_agent,
+        help=f"first agent, as name or name:depth ({', '.join(AGENTS)})",
+    )
+    tournament.add_argument("agent_b", type=parse_agent, help="second agent")
+    tournament.add_argument("--games", type=positive_int, default=10)
+    tournament.add_argument("--seed", type=int, default=0)
+    tournament.add_argument(
+        "--workers",
+        type=positive_int,
+        default=None,
+        help="processes (default: CPU count)",
+    )
+
+    perft_parser = commands.add_parser(
+        "perft", help="count the boards reached from a position, and how fast"
+    )
+    perft_parser.add_argument("depth", type=int)
+    perft_parser.add_argument(
+        "--position", choices=list(PERFT_POSITIONS), default="start"
+    )
+
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="print the search statistics after each computer move",
+    )
+    parser.add_argument(
+        "--stats-file", help="append the search statistics to this file as JSON lines"
+    )
+
+    parser.add_argument(
+        "--ponder",
+        action="store_true",
+        help="let the pruning and iterative deepening players think while waiting for a key press",
+    )
+    parser.add_argument(
+        "--book",
+        default=DEFAULT_OPENING_BOOK,
+        help="opening book for the minimax players (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--no-book", dest="book", action="store_const", const=None, help="no book"
+    )
+
+    book_parser = commands.add_parser(
+        "book", help="build an opening book by searching the first moves deeply"
+    )
+    book_parser.add_argument("--output", default=DEFAULT_OPENING_BOOK)
+    book_parser.add_argument(
+        "--plies", type=int, default=6, help="how many moves into the game to cover"
+    )
+    book_parser.add_argument(
+        "--depth", type=int, default=3, help="search depth for each position"
+    )
+
+    args = parser.parse_args(args)
+
+    if args.command == "tournament":
+        summary = run_tournament(
+            args.agent_a, args.agent_b, args.games, args.seed, args.workers
+        )
+        name_a = agent_name(args.agent_a)
+        name_b = agent_name(args.agent_b)
+        print(f"{name_a} vs {name_b}, {args.games} games")
+        print(
+            f"{name_a} wins {summary['wins']}, loses {summary['losses']},"
+            f" draws {summary['draws']}"
+        )
+        print(f"average disc margin for {name_a}: {summary['margin']:+.2f}")
+        print(
+            f"average time per move: {name_a} {summary['seconds_per_move_a']:.4f}s,"
+            f" {name_b} {summary['seconds_per_move_b']:.4f}s"
+        )
+    elif args.command == "perft":
+        perft_report(args.position, args.depth)
+    elif args.command == "book":
+        count = build_opening_book(args.output, args.plies, args.depth, verbose=True)
+        print(f"wrote {count} positions to {args.output}")
+    else:
+        run_game(args.stats, args.stats_file, args.book, args.ponder)
+
+
 if __name__ == "__main__":
-    run_game()
+    main()
@@ -0,0 +1,292 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import othello
+
+# one engine process serving many games at once.  clients send one JSON object per line and get one
+# JSON object per line back, over TCP or stdin/stdout.  requests on one connection are handled
+# concurrently, so every response repeats the "id" of its request (if it had one).
+#
+#   {"command": "new", "agent": "heuristic", "depth": 2, "time": null}  start a game
+#   {"command": "play", "game": 1, "move": [4, 6]}                      play a move for the side to move
+#   {"command": "move", "game": 1}                                      let the engine move
+#   {"command": "set", "game": 1, "agent": "mcts", "depth": 300}        change the engine's settings
+#   {"command": "state", "game": 1}                                     get the board
+#   {"command": "close", "game": 1}                                     forget a game
+#
+# agent is one of othello.AGENTS, depth is its depth (or playouts for mcts), and time is an optional
+# time limit per move in seconds: the minimax agents then search with iterative deepening up to depth,
+# and mcts plays for that long.  boards are sent as the 100 squares of the state, row by row.
+# searches run on a bounded process pool, so a long search never holds up the other games
+
+DEFAULT_PORT = 8765
+
+# the deepest each agent may search without a time limit, so one request can't hold a worker for
+# minutes.  on the midgame position ndepth:2 takes about 1.5s and pruning:4 about 50s.  for mcts it
+# is the number of playouts
+MAX_DEPTHS = {"ndepth": 2, "pruning": 4, "heuristic": 4, "mcts": 100000}
+# with a time limit the depth is only the deepest iteration, the time limit ends the search
+MAX_TIMED_DEPTH = 50
+MAX_TIME_LIMIT = 60.0
+# requests a connection may have in flight.  past that the server stops reading from it until some
+# are answered, so a client that doesn't read its replies can't pile up requests
+MAX_PENDING = 64
+
+
+# runs in a worker process: finds the engine's move for turn
+def search_move(state, turn, agent, depth, time_limit):
+    board = othello.Board()
+    board.state = state
+    move_list = board.valid_moves(turn)
+    if time_limit is not None:
+        if agent == "mcts":
+            return othello.get_mcts_move(board, turn, time_limit)
+        if agent in ["ndepth", "pruning", "heuristic"]:
+            return othello.get_mini_max_move_iterative_deepening(
+                board, turn, time_limit, max_depth=depth, heuristic=agent == "heuristic"
+            )
+    return othello.get_agent_move(agent, board, move_list, turn, depth)
+
+
+def init_worker(book):
+    if book is not None and os.path.exists(book):
+        othello.load_opening_book(book)
+
+
+# a request that can't be carried out.  the message is sent back to the client
+class RequestError(Exception):
+    pass
+
+
+# one game being played through the server
+class Session:
+    def __init__(self, agent="heuristic", depth=2, time_limit=None):
+        self.board = othello.Board()
+        self.turn = 1
+        self.agent = agent
+        self.depth = depth
+        self.time_limit = time_limit
+        # one move at a time: a move request waits for the one before it
+        self.lock = asyncio.Lock()
+
+    def play(self, move):
+        if move not in self.board.valid_moves(self.turn):
+            raise RequestError(f"{list(move)} is not a valid move")
+        self.board.place(move[0], move[1], self.turn)
+        # a player without moves passes
+        if self.board.has_any_move(-self.turn) or not self.board.has_any_move(
+            self.turn
+        ):
+            self.turn = -self.turn
+
+    def to_dict(self):
+        return {
+            "board": list(self.board.state),
+            "turn": self.turn,
+            "moves": [list(move) for move in self.board.valid_moves(self.turn)],
+            "over": self.board.end(),
+            "score": {
+                "x": self.board.calculate_score(1),
+                "o": self.board.calculate_score(-1),
+            },
+        }
+
+
+class EngineServer:
+    def __init__(self, workers=None, book=othello.DEFAULT_OPENING_BOOK):
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers, initializer=init_worker, initargs=(book,)
+        )
+        # game id -> Session.  games aren't tied to a connection, a client can come back to one
+        self.sessions = {}
+        self.ids = itertools.count(1)
+
+    def close(self):
+        self.pool.shutdown()
+
+    # carries out one request and returns the response
+    async def handle(self, request):
+        command = request.get("command")
+        if command == "new":
+            session = Session()
+            self.configure(session, request)
+            game = next(self.ids)
+            self.sessions[game] = session
+            return {"game": game, **session.to_dict()}
+
+        session = self.sessions.get(request.get("game"))
+        if session is None:
+            raise RequestError(f"unknown game {request.get('game')}")
+        game = request["game"]
+
+        if command == "play":
+            async with session.lock:
+                move = request.get("move")
+                if not isinstance(move, list) or len(move) != 2:
+                    raise RequestError("move must be [x, y]")
+                session.play(tuple(move))
+                return {"game": game, **session.to_dict()}
+        elif command == "move":
+            async with session.lock:
+                if session.board.end():
+                    raise RequestError("the game is over")
+                loop = asyncio.get_running_loop()
+                move = await loop.run_in_executor(
+                    self.pool,
+                    search_move,
+                    list(session.board.state),
+                    session.turn,
+                    session.agent,
+                    session.depth,
+                    session.time_limit,
+                )
+                session.play(tuple(move))
+                return {"game": game, "move": list(move), **session.to_dict()}
+        elif command == "set":
+            self.configure(session, request)
+            return {"game": game, "agent": session.agent, "depth": session.depth}
+        elif command == "state":
+            return {"game": game, **session.to_dict()}
+        elif command == "close":
+            del self.sessions[game]
+            return {"game": game}
+        raise RequestError(f"unknown command {command}")
+
+    # applies the agent, depth and time of a request to the session.  nothing changes if any of
+    # them is invalid
+    def configure(self, session, request):
+        agent = request.get("agent", session.agent)
+        if agent not in othello.AGENTS:
+            raise RequestError(
+                f"unknown agent {agent}, choose from {', '.join(othello.AGENTS)}"
+            )
+        depth = request.get("depth")
+        if depth is None:
+            depth = (
+                othello.parse_agent(agent)[1] if "agent" in request else session.depth
+            )
+        time_limit = request.get("time", session.time_limit)
+
+        if time_limit is not None:
+            if isinstance(time_limit, bool) or not isinstance(time_limit, (int, float)):
+                raise RequestError("time must be a number of seconds")
+            if not 0 < time_limit <= MAX_TIME_LIMIT:
+                raise RequestError(f"time must be above 0 and at most {MAX_TIME_LIMIT}")
+        if isinstance(depth, bool) or not isinstance(depth, int):
+            raise RequestError("depth must be a whole number")
+        if time_limit is not None and agent != "mcts":
+            max_depth = MAX_TIMED_DEPTH
+        else:
+            max_depth = MAX_DEPTHS.get(agent, MAX_TIMED_DEPTH)
+        if not 1 <= depth <= max_depth:
+            raise RequestError(f"depth for {agent} must be from 1 to {max_depth}")
+
+        session.agent = agent
+        session.depth = depth
+        session.time_limit = None if time_limit is None else float(time_limit)
+
+    # handles one request line and writes its response line
+    async def respond(self, line, writer, write_lock):
+        response = {}
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise RequestError("requests must be JSON objects")
+            if "id" in request:
+                response["id"] = request["id"]
+            response.update(await self.handle(request))
+            response["ok"] = True
+        except Exception as error:
+            # anything else (a worker process dying, say) still gets an answer, so the client
+            # isn't left waiting for one
+            response["ok"] = False
+            response["error"] = str(error) or type(error).__name__
+        # the requests of a connection share its writer, and only one of them may wait in drain()
+        async with write_lock:
+            try:
+                writer.write((json.dumps(response) + "\n").encode())
+                await writer.drain()
+            except ConnectionError:
+                # the client is gone, there is no one to answer
+                pass
+
+    # reads requests from one client until it disconnects
+    async def serve(self, reader, writer):
+        write_lock = asyncio.Lock()
+        pending = asyncio.Semaphore(MAX_PENDING)
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                await pending.acquire()
+                task = asyncio.create_task(self.respond(line, writer, write_lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                task.add_done_callback(lambda task: pending.release())
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            writer.close()
+
+
+async def serve_tcp(engine, host, port):
+    server = await asyncio.start_server(engine.serve, host, port)
+    print(f"serving on {host}:{server.sockets[0].getsockname()[1]}", file=sys.stderr)
+    async with server:
+        await server.serve_forever()
+
+
+async def serve_stdio(engine):
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), sys.stdin
+    )
+    transport, protocol = await loop.connect_write_pipe(
+        asyncio.streams.FlowControlMixin, sys.stdout
+    )
+    writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+    await engine.serve(reader, writer)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Serve othello games as line-oriented JSON over TCP or stdin/stdout"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument(
+        "--stdio", action="store_true", help="talk over stdin/stdout instead of TCP"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="search processes (default: CPU count)",
+    )
+    parser.add_argument("--book", default=othello.DEFAULT_OPENING_BOOK)
+    args = parser.parse_args(args)
+
+    engine = EngineServer(args.workers, args.book)
+    try:
+        if args.stdio:
+            asyncio.run(serve_stdio(engine))
+        else:
+            asyncio.run(serve_tcp(engine, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+import benchmark
+import pytest
+
+
+def test_measure():
+
+    result = benchmark.measure("pruning", 1, "opening", repeat=1)
+
+    assert result["seconds"] > 0
+    assert result["nodes"] == 39
+    assert result["peak_memory"] > 0
+
+
+def test_find_regressions():
+
+    baseline = {
+        "greedy/opening": {"seconds": 1.0, "nodes": 10, "peak_memory": 1000},
+        "greedy/midgame": {"seconds": 1.0, "nodes": 10, "peak_memory": 1000},
+    }
+    results = {
+        "greedy/opening": {"seconds": 1.2, "nodes": 10, "peak_memory": 900},
+        "greedy/midgame": {"seconds": 2.0, "nodes": 11, "peak_memory": 1000},
+        "greedy/endgame": {"seconds": 9.0, "nodes": 99, "peak_memory": 9999},
+    }
+    tolerances = {"seconds": 0.5, "nodes": 0.0, "peak_memory": 0.5}
+
+    assert benchmark.find_regressions(results, baseline, tolerances) == [
+        ("greedy/midgame", "seconds", 1.0, 2.0),
+        ("greedy/midgame", "nodes", 10, 11),
+    ]
@@ -1,7 +1,26 @@
+import random
+
 import othello
 import pytest
 
 
+# the moves of a random game as (move, turn) pairs.  a player without moves passes, so the turns
+# don't always alternate.  the same seed gives the same game
+def random_game(seed):
+    rng = random.Random(seed)
+    board = othello.Board()
+    turn = 1
+    moves = []
+    while not board.end():
+        move_list = board.valid_moves(turn)
+        if len(move_list) > 0:
+            move = rng.choice(move_list)
+            board.place(*move, turn)
+            moves.append((move, turn))
+        turn = -turn
+    return moves
+
+
 def test_get_greedy_move():
 
     board = othello.Board()
@@ -336,3 +355,534 @@ def test_get_minimax_nd_move():
     best_move = othello.get_mini_max_move_n_depth(board, board.valid_moves(1), 1, 2)
 
     assert best_move in [(6, 3), (8, 2)]
+
+
+def test_valid_moves_starting_board():
+
+    board = othello.Board()
+
+    assert board.valid_moves(1) == [(3, 5), (4, 6), (5, 3), (6, 4)]
+    assert board.valid_moves(-1) == [(3, 4), (4, 3), (5, 6), (6, 5)]
+
+
+def test_bitboards_follow_state():
+
+    board = othello.Board()
+
+    for move, turn in random_game(0):
+        board.place(*move, turn)
+
+        for i in range(100):
+            assert board.bitboards[1] >> i & 1 == (board.state[i] == 1)
+            assert board.bitboards[-1] >> i & 1 == (board.state[i] == -1)
+
+
+def test_zobrist_hash_is_incremental():
+
+    board = othello.Board()
+
+    for move, turn in random_game(1):
+        board.place(*move, turn)
+
+        rebuilt = othello.Board()
+        rebuilt.state = list(board.state)
+        assert board.hash == rebuilt.hash
+
+
+def test_transposition_table_search():
+
+    board = othello.Board()
+    table = othello.TranspositionTable()
+
+    move = othello.get_mini_max_move_n_depth_pruning(board, 1, 2, table=table)
+
+    assert move in board.valid_moves(1)
+    assert len(table.entries) > 0
+    depth, bound, value, best_move = table.entries[table.key(board, 1)]
+    assert depth == 4
+    assert best_move in board.valid_moves(1)
+    assert othello.get_mini_max_move_n_depth_pruning(board, 1, 2, table=table) in (
+        board.valid_moves(1)
+    )
+
+
+def test_make_unmake_move_restores_board():
+
+    board = othello.Board()
+    undo_list = []
+    boards = []
+
+    for move, turn in random_game(2):
+        boards.append((list(board.state), board.hash, dict(board.bitboards)))
+        undo_list.append(board.make_move(*move, turn))
+
+    assert board.make_move(0, 0, 1) is None
+
+    while undo_list:
+        board.unmake_move(undo_list.pop())
+        state, board_hash, bitboards = boards.pop()
+        assert list(board.state) == state
+        assert board.hash == board_hash
+        assert board.bitboards == bitboards
+
+
+def test_disc_counts_follow_state():
+
+    board = othello.Board()
+
+    for move, turn in random_game(3):
+        board = board.copy()
+        board.place(*move, turn)
+
+        assert board.calculate_score(1) == list(board.state).count(1)
+        assert board.calculate_score(-1) == list(board.state).count(-1)
+        assert board.empty_count == list(board.state).count(0)
+        assert board.score(-1) == -board.evaluate()
+
+
+def test_search_budget_stops_search():
+
+    board = othello.Board()
+    budget = othello.SearchBudget(node_limit=10)
+
+    with pytest.raises(othello.SearchTimeout):
+        othello.get_mini_max_move_n_depth_pruning(board, 1, 3, budget=budget)
+
+    assert budget.nodes == 11
+
+
+def test_search_stats():
+
+    board = othello.Board()
+    stats = othello.SearchStats()
+    budget = othello.SearchBudget()
+
+    othello.get_mini_max_move_n_depth_pruning(board, 1, 2, budget=budget, stats=stats)
+
+    # the root board is counted too, the budget only counts the boards below it
+    assert stats.nodes == budget.nodes + 1
+    assert stats.nodes_per_ply[:2] == [1, 4]
+    assert len(stats.nodes_per_ply) == 5
+    assert stats.leaves == stats.nodes_per_ply[4]
+    assert stats.evaluations == stats.leaves
+    assert stats.cutoffs == sum(stats.cutoffs_at_move) > 0
+    assert stats.copies == 1
+    assert stats.seconds > 0
+    assert stats.to_dict()["nodes"] == stats.nodes
+
+
+def test_get_iterative_deepening_move():
+
+    board = othello.Board()
+
+    move = othello.get_mini_max_move_iterative_deepening(
+        board, 1, time_limit=None, node_limit=2000
+    )
+
+    assert move in board.valid_moves(1)
+
+
+def test_move_ordering():
+
+    ordering = othello.MoveOrdering()
+    moves = [(1, 1), (4, 2), (0, 2), (9, 9)]
+
+    assert ordering.order(moves, 4) == [(9, 9), (0, 2), (4, 2), (1, 1)]
+
+    ordering.record_cutoff((4, 2), 4, 2)
+    ordering.record_cutoff((1, 1), 4, 2)
+
+    assert ordering.order(moves, 4) == [(1, 1), (4, 2), (9, 9), (0, 2)]
+    # killers only apply to their own ply, the history applies everywhere
+    assert ordering.order(moves, 3) == [(4, 2), (1, 1), (9, 9), (0, 2)]
+
+
+def test_pruning_matches_minimax():
+
+    rng = random.Random(4)
+    board = othello.Board()
+    turn = 1
+
+    for _ in range(12):
+        move_list = board.valid_moves(turn)
+        board.place(*rng.choice(move_list), turn)
+        turn = -turn
+
+    value = othello.get_mini_max_move_n_depth(
+        board, board.valid_moves(turn), turn, 2, top_level=False
+    )
+
+    assert (
+        othello.get_mini_max_move_n_depth_pruning(board, turn, 2, top_level=False)
+        == value
+    )
+    assert (
+        othello.get_mini_max_move_n_depth_pruning(
+            board,
+            turn,
+            2,
+            top_level=False,
+            table=othello.TranspositionTable(),
+            ordering=othello.MoveOrdering(),
+        )
+        == value
+    )
+
+
+def test_negamax_pass():
+
+    board = othello.Board()
+    board.state = [1, -1] + [0] * 98
+    engine = othello.SearchEngine()
+
+    # O can't move, so X moves twice in a row and ends up with 3 pieces against none
+    assert board.valid_moves(-1) == []
+    assert engine.negamax(board, -1, 1) == -3
+    assert engine.best_moves(board, 1, board.valid_moves(1), 1) == (3, [(2, 0)])
+
+
+def test_parallel_search_matches_serial():
+
+    rng = random.Random(5)
+    board = othello.Board()
+    turn = 1
+
+    for _ in range(10):
+        move_list = board.valid_moves(turn)
+        board.place(*rng.choice(move_list), turn)
+        turn = -turn
+
+    engine = othello.SearchEngine(othello.evaluate_heuristic)
+    move_list = board.valid_moves(turn)
+
+    value, best_moves = engine.best_moves(board, turn, move_list, 2)
+    parallel_value, parallel_best_moves = engine.best_moves_parallel(
+        board, turn, move_list, 2, workers=2
+    )
+
+    assert parallel_value == value
+    assert sorted(parallel_best_moves) == sorted(best_moves)
+    assert othello.get_mini_max_move_n_depth_pruning(board, turn, 1, workers=2) in (
+        move_list
+    )
+
+
+def test_play_game_is_repeatable():
+
+    result = othello.play_game(("greedy", 2), ("random", 2), 3)
+    again = othello.play_game(("greedy", 2), ("random", 2), 3)
+
+    assert (result["score_x"], result["score_o"]) == (
+        again["score_x"],
+        again["score_o"],
+    )
+    assert result["score_x"] + result["score_o"] <= 100
+    assert result["moves"][1] > 0 and result["moves"][-1] > 0
+
+
+def test_run_tournament():
+
+    summary = othello.run_tournament(("greedy", 2), ("random", 2), 4, workers=2)
+
+    assert summary["wins"] + summary["losses"] + summary["draws"] == 4
+    assert summary["seconds_per_move_a"] >= 0
+
+    with pytest.raises(ValueError):
+        othello.run_tournament(("greedy", 2), ("random", 2), 0)
+    with pytest.raises(SystemExit):
+        othello.main(["tournament", "greedy", "random", "--games", "0"])
+    with pytest.raises(SystemExit):
+        othello.main(["tournament", "ndepth:-1", "random"])
+
+
+# reference perft counts, checked against the original move generator
+PERFT_COUNTS = {
+    "start": [4, 12, 56, 244, 1396],
+    "opening": [7, 35, 254, 1935],
+    "midgame": [18, 359, 5882],
+    "endgame": [9, 28, 194, 627, 3481, 11012],
+}
+
+
+@pytest.mark.parametrize("position", list(PERFT_COUNTS))
+def test_perft(position):
+
+    board, turn = othello.board_from_moves(othello.PERFT_POSITIONS[position])
+    state = list(board.state)
+
+    for depth, count in enumerate(PERFT_COUNTS[position], 1):
+        assert othello.perft(board, turn, depth) == count
+
+    assert list(board.state) == state
+
+
+def test_opening_book(tmp_path):
+
+    path = str(tmp_path / "book.bin")
+    count = othello.build_opening_book(path, plies=2, depth=1)
+    assert count == 5
+
+    board = othello.Board()
+    engine = othello.SearchEngine(othello.evaluate_heuristic)
+    value, moves = engine.best_moves(board, 1, board.valid_moves(1), 2)
+
+    book = othello.load_opening_book(path)
+    try:
+        assert len(book) == 5
+        assert book.lookup(board, 1) == (moves[0], pytest.approx(value))
+        # the same board with the other player to move isn't in the book
+        assert book.lookup(board, -1) is None
+        assert othello.get_mini_max_move_n_depth_pruning(board, 1, 3) == moves[0]
+        board.place(moves[0][0], moves[0][1], 1)
+        board.place(*board.valid_moves(-1)[0], -1)
+        assert othello.get_book_move(board, 1) is None
+    finally:
+        othello.load_opening_book(None)
+
+    with open(path, "r+b") as file:
+        file.write(b"XXXX")
+    with pytest.raises(ValueError):
+        othello.OpeningBook(path)
+
+
+def test_endgame_solver():
+
+    # the first board of a random game with 8 or fewer empty squares, and the player to move
+    board = othello.Board()
+    for move, turn in random_game(5):
+        if board.empty_count <= 8:
+            break
+        board.place(*move, turn)
+
+    move_list = board.valid_moves(turn)
+    engine = othello.SearchEngine(othello.evaluate_score, prune=False)
+    value, best_moves = engine.best_moves(board, turn, move_list, board.empty_count)
+
+    solver = othello.EndgameSolver()
+    assert solver.best_moves(board, turn, move_list) == (value, best_moves)
+    assert solver.negamax(board.copy(), turn) == value
+    wld, _ = othello.EndgameSolver().best_moves(board, turn, move_list, wld=True)
+    assert wld == (value > 0) - (value < 0)
+
+    move = othello.get_mini_max_move_n_depth_pruning_heuristic(board, turn, 1)
+    assert move in best_moves
+
+
+def test_endgame_solver_keeps_to_the_budget():
+
+    # the first board of a random game with 10 or fewer empty squares, and the player to move
+    board = othello.Board()
+    for move, turn in random_game(5):
+        if board.empty_count <= 10:
+            break
+        board.place(*move, turn)
+
+    # the solver runs out of boards right away, so the move comes from the depth 1 search
+    stats = othello.SearchStats()
+    move = othello.get_mini_max_move_iterative_deepening(
+        board, turn, time_limit=None, node_limit=1, stats=stats
+    )
+    assert move in board.valid_moves(turn)
+    assert list(stats.seconds_per_depth) == [1]
+
+
+def test_board_key():
+
+    board = othello.Board()
+    board.place(4, 6, 1)
+
+    key = board.key()
+    assert key == board.get_board_id()
+    assert key != othello.Board().key()
+
+    copy = othello.Board.from_key(key)
+    assert copy.state == board.state
+    assert copy.bitboards == board.bitboards
+    assert copy.hash == board.hash
+    assert copy.key() == key
+
+
+def test_board_is_compact():
+
+    board = othello.Board()
+    assert not hasattr(board, "__dict__")
+
+    # lists can still be assigned, the board keeps its own copy
+    state = [0] * 100
+    state[0] = 1
+    board.state = state
+    state[1] = -1
+    assert board.state[0] == 1 and board.state[1] == 0
+    assert board.bitboards == {1: 1, -1: 0}
+
+    board = othello.Board()
+    copy = board.copy()
+    copy.place(4, 6, 1)
+    assert copy.state[64] == 1
+    assert board.state[64] == 0
+
+
+def test_frontier_follows_moves():
+
+    board = othello.Board()
+    undo_list = []
+
+    assert board.frontier == othello.Board.from_key(board.key()).frontier
+    for move, turn in random_game(3):
+        undo_list.append(board.make_move(*move, turn))
+        rebuilt = othello.Board.from_key(board.key())
+        assert board.frontier == rebuilt.frontier
+        assert board.copy().frontier == board.frontier
+        for i in range(100):
+            empty = board.state[i] == 0
+            next_to_piece = any(
+                board.index(i % 10 + dx, i // 10 + dy) in (1, -1)
+                for dx, dy in othello.STEPS
+            )
+            assert (board.frontier >> i) & 1 == (empty and next_to_piece)
+
+    while undo_list:
+        board.unmake_move(undo_list.pop())
+        assert board.frontier == othello.Board.from_key(board.key()).frontier
+
+
+def test_iter_moves():
+
+    board, turn = othello.board_from_moves(othello.PERFT_POSITIONS["midgame"])
+
+    moves = list(board.iter_moves(turn))
+    assert sorted(moves) == board.valid_moves(turn)
+    priorities = [othello.SQUARE_PRIORITY[x + y * 10] for x, y in moves]
+    assert priorities == sorted(priorities, reverse=True)
+
+    # the first move comes first if it is valid, and isn't repeated
+    last = moves[-1]
+    assert list(board.iter_moves(turn, first=last)) == [last] + moves[:-1]
+    assert list(board.iter_moves(turn, first=(0, 0))) == moves
+
+    # nothing is generated before it is asked for
+    iterator = board.iter_moves(turn)
+    assert next(iterator) == moves[0]
+
+    for player in [1, -1]:
+        assert board.has_any_move(player)
+    board.state = [1] * 50 + [0] * 50
+    assert not board.has_any_move(1)
+    assert not board.has_any_move(-1)
+    assert board.end()
+
+
+def test_move_masks_are_cached():
+
+    board = othello.Board()
+    undo_list = []
+    masks = []
+
+    for move, turn in random_game(6):
+        assert move in board.valid_moves(turn)
+        rebuilt = othello.Board.from_key(board.key())
+        cached = board.x_moves if turn == 1 else board.o_moves
+        assert cached == rebuilt.move_mask(turn)
+        masks.append((board.x_moves, board.o_moves))
+        undo_list.append(board.make_move(*move, turn))
+        # a move clears the masks, they belong to the old board
+        assert board.x_moves is None and board.o_moves is None
+
+    while undo_list:
+        board.unmake_move(undo_list.pop())
+        assert (board.x_moves, board.o_moves) == masks.pop()
+
+
+def test_random_playout():
+
+    random.seed(0)
+    board = othello.Board()
+
+    winner = othello.random_playout(board, 1)
+
+    assert board.end()
+    assert winner == (board.score(1) > 0) - (board.score(1) < 0)
+
+
+def test_mcts_move():
+
+    random.seed(0)
+    board = othello.Board()
+    mcts = othello.MCTS()
+
+    move = othello.get_mcts_move(board, 1, playouts=100, mcts=mcts)
+
+    assert move in board.valid_moves(1)
+    assert mcts.root.visits == 100
+    assert sum(child.visits for child in mcts.root.children) == 100
+
+    # after our move and the reply, the search starts from the node already in the tree
+    board.place(move[0], move[1], 1)
+    reply = board.valid_moves(-1)[0]
+    board.place(reply[0], reply[1], -1)
+    old_root = mcts.root
+    node = next(child for child in old_root.children if child.move == move)
+    node = next((child for child in node.children if child.move == reply), None)
+    visits = 0 if node is None else node.visits
+
+    othello.get_mcts_move(board, 1, playouts=50, mcts=mcts)
+
+    assert mcts.root.key == board.key()
+    assert mcts.root.parent is None
+    assert mcts.root.visits == visits + 50
+
+    with pytest.raises(ValueError):
+        othello.get_mcts_move(board, 1, time_limit=None)
+    if node is not None:
+        assert mcts.root is node
+
+
+def test_ponderer():
+
+    def search(board, turn, budget):
+        return othello.get_mini_max_move_n_depth_pruning(board, turn, 1, budget=budget)
+
+    board = othello.Board()
+    board.place(4, 6, 1)
+    ponderer = othello.Ponderer(search)
+    ponderer.start(board, -1)
+    ponderer.thread.join()
+
+    reply = board.valid_moves(-1)[0]
+    board.place(reply[0], reply[1], -1)
+    move = ponderer.take(board, 1)
+    assert move in board.valid_moves(1)
+    # a board that wasn't pondered
+    assert ponderer.take(othello.Board(), 1) is None
+
+
+def test_ponderer_stops():
+
+    def search(board, turn, budget):
+        return othello.get_mini_max_move_n_depth_pruning(board, turn, 10, budget=budget)
+
+    board = othello.Board()
+    ponderer = othello.Ponderer(search)
+    ponderer.start(board, 1)
+
+    board.place(4, 6, 1)
+    assert ponderer.take(board, -1) is None
+    assert ponderer.thread is None
+
+
+def test_ponderer_drops_stopped_searches():
+
+    # iterative deepening returns a move when it is stopped instead of raising SearchTimeout
+    def search(board, turn, budget):
+        return othello.get_mini_max_move_iterative_deepening(
+            board, turn, time_limit=None, max_depth=10, stop=budget.stop
+        )
+
+    board = othello.Board()
+    board.place(4, 6, 1)
+    ponderer = othello.Ponderer(search)
+    ponderer.start(board, -1)
+
+    reply = board.valid_moves(-1)[0]
+    board.place(reply[0], reply[1], -1)
+    assert ponderer.take(board, 1) is None
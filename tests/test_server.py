@@ -0,0 +1,154 @@
+import asyncio
+import json
+
+import othello
+import pytest
+import server
+
+
+# starts a server on a free port, runs client(reader, writer) against it and returns its result
+def with_server(client, workers=2):
+
+    async def run():
+        engine = server.EngineServer(workers, book=None)
+        tcp = await asyncio.start_server(engine.serve, "127.0.0.1", 0)
+        port = tcp.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            result = await client(reader, writer)
+            writer.close()
+            return result
+        finally:
+            tcp.close()
+            await tcp.wait_closed()
+            engine.close()
+
+    return asyncio.run(run())
+
+
+async def send(reader, writer, request):
+    writer.write((json.dumps(request) + "\n").encode())
+    await writer.drain()
+    return json.loads(await reader.readline())
+
+
+def test_server_plays_a_game():
+
+    async def client(reader, writer):
+        new = await send(reader, writer, {"command": "new", "agent": "pruning:1"})
+        assert not new["ok"]
+        new = await send(
+            reader, writer, {"command": "new", "agent": "pruning", "depth": 1}
+        )
+        assert new["ok"] and new["turn"] == 1
+        game = new["game"]
+        assert new["board"] == list(othello.Board().state)
+
+        played = await send(
+            reader, writer, {"command": "play", "game": game, "move": [4, 6]}
+        )
+        assert played["ok"] and played["turn"] == -1
+
+        moved = await send(reader, writer, {"command": "move", "game": game})
+        assert moved["ok"] and moved["turn"] == 1
+        board, turn = othello.board_from_moves([(4, 6), tuple(moved["move"])])
+        assert moved["board"] == list(board.state)
+
+        bad = await send(
+            reader, writer, {"command": "play", "game": game, "move": [0, 0]}
+        )
+        assert not bad["ok"] and "not a valid move" in bad["error"]
+        changed = await send(
+            reader, writer, {"command": "set", "game": game, "agent": "greedy"}
+        )
+        assert changed["ok"] and changed["agent"] == "greedy"
+        # with a time limit the depth only caps iterative deepening
+        timed = {"command": "set", "game": game, "agent": "pruning", "depth": 8}
+        assert not (await send(reader, writer, timed))["ok"]
+        timed["time"] = 0.1
+        assert (await send(reader, writer, timed))["ok"]
+
+        closed = await send(reader, writer, {"command": "close", "game": game})
+        assert closed["ok"]
+        gone = await send(reader, writer, {"command": "state", "game": game})
+        assert not gone["ok"]
+        broken = await send(reader, writer, {"command": "new", "depth": "deep"})
+        assert not broken["ok"]
+
+    with_server(client)
+
+
+def test_server_games_run_concurrently():
+
+    async def client(reader, writer):
+        games = []
+        for _ in range(4):
+            new = await send(
+                reader, writer, {"command": "new", "agent": "heuristic", "depth": 1}
+            )
+            games.append(new["game"])
+        # ask every game for a move at once and match the answers up by id
+        for game in games:
+            request = {"command": "move", "game": game, "id": f"move-{game}"}
+            writer.write((json.dumps(request) + "\n").encode())
+        await writer.drain()
+        responses = [json.loads(await reader.readline()) for _ in games]
+        return {response["id"]: response for response in responses}
+
+    responses = with_server(client)
+    assert len(responses) == 4
+    for response in responses.values():
+        assert response["ok"] and response["turn"] == -1
+
+
+@pytest.mark.parametrize(
+    "request_",
+    [
+        {"command": "new", "depth": 1e999},
+        {"command": "new", "depth": 1.5},
+        {"command": "new", "agent": "ndepth", "depth": 50},
+        {"command": "new", "agent": "pruning", "depth": 0},
+        {"command": "new", "time": -1},
+        {"command": "new", "time": "soon"},
+    ],
+)
+def test_server_rejects_bad_settings(request_):
+
+    async def client(reader, writer):
+        return await send(reader, writer, request_)
+
+    response = with_server(client, workers=1)
+    assert not response["ok"] and response["error"]
+
+
+def test_server_answers_unexpected_errors(monkeypatch):
+
+    def broken(session):
+        raise RuntimeError("broken")
+
+    monkeypatch.setattr(server.Session, "to_dict", broken)
+
+    async def client(reader, writer):
+        return await send(reader, writer, {"command": "new", "id": 7})
+
+    assert with_server(client, workers=1) == {"id": 7, "ok": False, "error": "broken"}
+
+
+def test_server_handles_a_flood_of_requests():
+
+    async def client(reader, writer):
+        errors = []
+        loop = asyncio.get_running_loop()
+        loop.set_exception_handler(lambda loop, context: errors.append(context))
+        await send(reader, writer, {"command": "new"})
+        # far more replies than the socket buffers hold, sent before reading any of them
+        writer.write(b'{"command": "state", "game": 1}\n' * 20000)
+        await writer.drain()
+        await asyncio.sleep(0.2)
+        replies = [json.loads(await reader.readline()) for _ in range(20000)]
+        # only the errors up to here: the server shutting down afterwards may add its own
+        return list(errors), replies
+
+    errors, replies = with_server(client, workers=1)
+    assert errors == []
+    assert all(reply["ok"] for reply in replies)
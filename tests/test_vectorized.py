@@ -0,0 +1,91 @@
+import random
+
+import othello
+import pytest
+
+np = pytest.importorskip("numpy")
+vectorized = pytest.importorskip("vectorized")
+
+
+def random_boards(games, seed):
+    random.seed(seed)
+    boards = []
+    for _ in range(games):
+        board = othello.Board()
+        turn = 1
+        while not board.end():
+            move_list = board.valid_moves(turn)
+            if len(move_list) > 0:
+                board.place(*random.choice(move_list), turn)
+                boards.append(board.copy())
+            turn = -turn
+    return boards
+
+
+def test_move_masks_match_board():
+
+    boards = random_boards(3, 0)
+    states = vectorized.stack_boards(boards)
+
+    assert states.shape == (len(boards), 100)
+    for player in [1, -1]:
+        masks = vectorized.move_masks(states, player)
+        for board, mask in zip(boards, masks):
+            squares = sorted((int(i) % 10, int(i) // 10) for i in np.flatnonzero(mask))
+            assert squares == board.valid_moves(player)
+
+
+def test_evaluate_heuristic_matches_board():
+
+    boards = random_boards(3, 1)
+    states = vectorized.stack_boards(boards)
+
+    for player in [1, -1]:
+        values = vectorized.evaluate_heuristic(states, player)
+        expected = [othello.evaluate_heuristic(board, player) for board in boards]
+        assert values == pytest.approx(expected)
+
+
+def test_evaluate_children_matches_negamax():
+
+    for board in random_boards(1, 2)[:40:4]:
+        for player in [1, -1]:
+            if len(board.valid_moves(player)) == 0:
+                continue
+            engine = othello.SearchEngine(othello.evaluate_heuristic, prune=False)
+            value, move = vectorized.evaluate_children(board, player)
+            assert value == pytest.approx(engine.negamax(board, player, 1))
+            assert move in board.valid_moves(player)
+
+
+def test_word_move_masks_match_board():
+
+    boards = random_boards(2, 3)
+    states = vectorized.stack_boards(boards)
+    own = vectorized.pack(states == 1)
+    opponent = vectorized.pack(states == -1)
+
+    assert (vectorized.unpack(*own) == (states == 1)).all()
+    masks = vectorized.unpack(*vectorized.word_move_masks(own, opponent))
+    assert (masks == vectorized.move_masks(states, 1)).all()
+
+
+def test_random_playouts():
+
+    boards = [othello.Board()] * 50 + random_boards(1, 4)[40:60]
+    states = vectorized.stack_boards(boards)
+    players = np.array([1] * 50 + [-1, 1] * 10, dtype=np.int8)
+
+    final, winners = vectorized.random_playouts(states, players, seed=0)
+
+    assert final.shape == states.shape
+    for state, winner in zip(final, winners):
+        board = othello.Board()
+        board.state = state
+        assert board.end()
+        assert winner == (board.score(1) > 0) - (board.score(1) < 0)
+    # pieces are never taken off the board
+    assert ((states != 0) <= (final != 0)).all()
+
+    again, _ = vectorized.random_playouts(states, players, seed=0)
+    assert (again == final).all()
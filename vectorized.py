@@ -0,0 +1,305 @@
+import argparse
+import time
+
+import othello
+
+try:
+    import numpy as np
+except ImportError:
+    raise ImportError("vectorized.py needs numpy, install it with: pip install numpy")
+
+# corner squares of the 10x10 board, as indices into a flat board
+CORNERS = [0, 9, 90, 99]
+
+# every square except the ones in the leftmost and rightmost columns, like othello.INNER_COLUMNS_MASK
+INNER_COLUMNS = np.ones(100, dtype=bool)
+INNER_COLUMNS[0::10] = False
+INNER_COLUMNS[9::10] = False
+
+# the 8 directions as (shift along the flat board, whether the step moves sideways and so has to
+# stay off the left and right columns), the same as othello.DIRECTIONS
+DIRECTIONS = [(dx + dy * 10, dx != 0) for dx, dy in othello.STEPS]
+
+
+# turns boards (or their states) into an (N, 100) int8 array, one row per board
+def stack_boards(boards):
+    states = [
+        board.state if isinstance(board, othello.Board) else board for board in boards
+    ]
+    return np.array(states, dtype=np.int8).reshape(len(states), 100)
+
+
+# shifts every square of a (N, 100) bool array step squares along the flat board, into out.
+# squares shifted in from outside the board are empty
+def shift(squares, step, out):
+    if step > 0:
+        out[:, :step] = False
+        out[:, step:] = squares[:, :-step]
+    else:
+        out[:, step:] = False
+        out[:, :step] = squares[:, -step:]
+    return out
+
+
+# (N, 100) bool array with every square where player can place a piece, for each board.
+# the same line growing as Board.move_mask, done for every board at once
+def move_masks(states, player):
+    own = states == player
+    opponent = states == -player
+    inner_opponent = opponent & INNER_COLUMNS
+    moves = np.zeros_like(own)
+    line = np.empty_like(own)
+    shifted = np.empty_like(own)
+    for step, sideways in DIRECTIONS:
+        line_mask = inner_opponent if sideways else opponent
+        np.logical_and(shift(own, step, line), line_mask, out=line)
+        # a line of opponent pieces is at most 8 squares long.  stop once no line grows any more
+        for _ in range(7):
+            np.logical_and(shift(line, step, shifted), line_mask, out=shifted)
+            np.logical_and(shifted, ~line, out=shifted)
+            if not shifted.any():
+                break
+            line |= shifted
+        moves |= shift(line, step, shifted)
+    moves &= states == 0
+    return moves
+
+
+# the heuristics of Board.calculate_heuristic for every board at once.  returns (token parity,
+# mobility, corners), each an array with one value per board from the point of view of player.
+# corners is the difference in corners held, scaled like the other two
+def heuristics(states, player):
+    own_count = np.count_nonzero(states == player, axis=1)
+    opponent_count = np.count_nonzero(states == -player, axis=1)
+    token_parity = 100 * (own_count - opponent_count) / (own_count + opponent_count)
+
+    own_mobility = np.count_nonzero(move_masks(states, player), axis=1)
+    opponent_mobility = np.count_nonzero(move_masks(states, -player), axis=1)
+    total = own_mobility + opponent_mobility
+    mobility = np.where(
+        total != 0,
+        100 * (own_mobility - opponent_mobility) / np.maximum(total, 1),
+        0,
+    )
+
+    corners = states[:, CORNERS]
+    own_corners = np.count_nonzero(corners == player, axis=1)
+    opponent_corners = np.count_nonzero(corners == -player, axis=1)
+    taken = own_corners + opponent_corners
+    corner_value = np.where(
+        taken != 0, 100 * (own_corners - opponent_corners) / np.maximum(taken, 1), 0
+    )
+
+    return token_parity, mobility, corner_value
+
+
+# othello.evaluate_heuristic for every board at once, plus the corner heuristic if corner_weight
+# is given (the single board heuristic doesn't look at corners, so it is left out by default)
+def evaluate_heuristic(states, player, corner_weight=0):
+    token_parity, mobility, corners = heuristics(states, player)
+    score = np.sum(states, axis=1, dtype=np.int64) * player
+    return score + mobility + token_parity + corner_weight * corners
+
+
+# negamax evaluation for a board one ply above the leaves: the value of each child is worked out
+# in one batch instead of one python call per child.  returns the same value a full width
+# SearchEngine.negamax(board, player, 1) would with evaluate_heuristic, and the best move.
+# player must have a move.  numpy's overhead makes this slower than evaluating one child at a time
+# for the handful of children a board has; batches of a few thousand boards are around 4x faster
+def evaluate_children(board, player, corner_weight=0):
+    moves = board.valid_moves(player)
+    children = []
+    for x, y in moves:
+        undo = board.make_move(x, y, player)
+        children.append(board._state[:])
+        board.unmake_move(undo)
+    values = -evaluate_heuristic(stack_boards(children), -player, corner_weight)
+    best = int(np.argmax(values))
+    return float(values[best]), moves[best]
+
+
+# the playouts below keep each board as bitboards like othello.Board, split over two uint64 words:
+# squares 0-63 in the low word and 64-99 in the high word.  one set of board wide shifts then handles
+# a whole batch with 2 numbers per board instead of 100 bools, which is several times faster
+HIGH_BITS = np.uint64((1 << 36) - 1)
+
+
+# splits a 100 bit int into its (low, high) words
+def split(bits):
+    return np.uint64(bits & ((1 << 64) - 1)), np.uint64(bits >> 64)
+
+
+# othello.DIRECTIONS with the masks split into words, and the shift as (left, amount, back): back
+# is 64 - amount, the shift that moves the bits crossing from one word into the other.  both are
+# uint64 already, since numpy before 2.0 turns a python int mixed with a uint64 into a float
+WORD_DIRECTIONS = [
+    (step > 0, np.uint64(abs(step)), np.uint64(64 - abs(step)), split(mask))
+    for step, mask in othello.DIRECTIONS
+]
+
+
+# (N, 100) bools -> the (low, high) words of each board's bitboard
+def pack(squares):
+    padded = np.zeros((len(squares), 128), dtype=bool)
+    padded[:, :100] = squares
+    words = np.packbits(padded, axis=1, bitorder="little").view(np.uint64)
+    return words[:, 0].copy(), words[:, 1].copy()
+
+
+# the (low, high) words of N bitboards -> (N, 100) bools
+def unpack(low, high):
+    words = np.stack([low, high], axis=1).view(np.uint8)
+    return np.unpackbits(words, axis=1, bitorder="little")[:, :100].astype(bool)
+
+
+# shifts bitboards toward higher squares (left) or lower squares by amount, across both words.
+# back is 64 - amount, as in WORD_DIRECTIONS
+def shift_words(low, high, left, amount, back):
+    if left:
+        return low << amount, ((high << amount) | (low >> back)) & HIGH_BITS
+    return (low >> amount) | (high << back), high >> amount
+
+
+# Board.move_mask for every board at once, on words.  returns the (low, high) words of the moves
+def word_move_masks(own, opponent):
+    empty_low = ~(own[0] | opponent[0])
+    empty_high = ~(own[1] | opponent[1]) & HIGH_BITS
+    moves_low = np.zeros_like(own[0])
+    moves_high = np.zeros_like(own[1])
+    for left, amount, back, (mask_low, mask_high) in WORD_DIRECTIONS:
+        line_low = opponent[0] & mask_low
+        line_high = opponent[1] & mask_high
+        low, high = shift_words(own[0], own[1], left, amount, back)
+        low &= line_low
+        high &= line_high
+        # a line of opponent pieces is at most 8 squares long
+        for _ in range(7):
+            grown_low, grown_high = shift_words(low, high, left, amount, back)
+            low |= grown_low & line_low
+            high |= grown_high & line_high
+        low, high = shift_words(low, high, left, amount, back)
+        moves_low |= low & empty_low
+        moves_high |= high & empty_high
+    return moves_low, moves_high
+
+
+# the pieces captured by placing a piece on each board's placed square (given as words)
+def word_flips(own, opponent, placed):
+    flips_low = np.zeros_like(own[0])
+    flips_high = np.zeros_like(own[1])
+    for left, amount, back, (mask_low, mask_high) in WORD_DIRECTIONS:
+        line_low = opponent[0] & mask_low
+        line_high = opponent[1] & mask_high
+        # the run of opponent pieces next to the placed piece in this direction.  it is captured if
+        # one of our own pieces closes it off
+        low, high = shift_words(placed[0], placed[1], left, amount, back)
+        low &= line_low
+        high &= line_high
+        for _ in range(7):
+            grown_low, grown_high = shift_words(low, high, left, amount, back)
+            low |= grown_low & line_low
+            high |= grown_high & line_high
+        end_low, end_high = shift_words(low, high, left, amount, back)
+        closed = ((end_low & own[0]) | (end_high & own[1])) != 0
+        flips_low |= np.where(closed, low, 0)
+        flips_high |= np.where(closed, high, 0)
+    return flips_low, flips_high
+
+
+# plays random games from every board at once until they all end.  states is an (N, 100) int8
+# array and players says who moves first on each board.  every round, each unfinished game makes
+# one random move, or passes if its player has no move; a game ends when neither player can move.
+# returns the final boards as an (N, 100) int8 array and the winner of each game (1, -1, or 0 for a
+# draw).  thousands of games in lockstep are much faster than othello.random_playout one at a time
+def random_playouts(states, players, seed=None):
+    rng = np.random.default_rng(seed)
+    states = np.asarray(states)
+    players = np.asarray(players, dtype=np.int8)
+
+    # each board as the pieces of the player to move and of the other player
+    relative = states * players[:, np.newaxis]
+    own = list(pack(relative == 1))
+    other = list(pack(relative == -1))
+    # the games still going (as rows of the original states), and whose turn it is in each
+    rows = np.arange(len(states))
+    turn = players.copy()
+    final_own = [np.zeros_like(own[0]), np.zeros_like(own[1])]
+    final_other = [np.zeros_like(own[0]), np.zeros_like(own[1])]
+    final_turn = players.copy()
+
+    while len(rows) > 0:
+        legal = unpack(*word_move_masks(own, other))
+        moves = np.count_nonzero(legal, axis=1)
+
+        # without a move the player passes, unless the opponent can't move either
+        stuck = moves == 0
+        finished = np.zeros_like(stuck)
+        if stuck.any():
+            reply = word_move_masks(
+                (other[0][stuck], other[1][stuck]), (own[0][stuck], own[1][stuck])
+            )
+            finished[stuck] = (reply[0] | reply[1]) == 0
+
+        # one random legal square per board: the first square where the running count of legal
+        # squares passes a random number below the number of moves
+        moving = ~stuck
+        choice = (rng.random(np.count_nonzero(moving)) * moves[moving]).astype(int)
+        running = np.cumsum(legal[moving], axis=1, dtype=np.int8)
+        squares = np.argmax(running > choice[:, None], axis=1)
+        squares = squares.astype(np.uint64)
+        one = np.uint64(1)
+        placed = (
+            np.where(squares < 64, one << (squares % np.uint64(64)), 0).astype(
+                np.uint64
+            ),
+            np.where(squares >= 64, one << (squares % np.uint64(64)), 0).astype(
+                np.uint64
+            ),
+        )
+        mover = (own[0][moving], own[1][moving])
+        waiting = (other[0][moving], other[1][moving])
+        flips = word_flips(mover, waiting, placed)
+        for word in range(2):
+            own[word][moving] = mover[word] | placed[word] | flips[word]
+            other[word][moving] = waiting[word] & ~flips[word]
+
+        # finished games are put aside, everyone else hands the turn over
+        if finished.any():
+            done = rows[finished]
+            for word in range(2):
+                final_own[word][done] = own[word][finished]
+                final_other[word][done] = other[word][finished]
+            final_turn[done] = turn[finished]
+        going = ~finished
+        rows = rows[going]
+        turn = -turn[going]
+        own, other = [other[0][going], other[1][going]], [own[0][going], own[1][going]]
+
+    signs = final_turn[:, np.newaxis]
+    states = unpack(*final_own) * signs - unpack(*final_other) * signs
+    states = states.astype(np.int8)
+    winners = np.sign(states.sum(axis=1, dtype=np.int64)).astype(np.int8)
+    return states, winners
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Play random games from the starting board, all at once"
+    )
+    parser.add_argument("games", type=int, nargs="?", default=10000)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(args)
+
+    states = stack_boards([othello.Board()] * args.games)
+    players = np.ones(args.games, dtype=np.int8)
+    started = time.perf_counter()
+    states, winners = random_playouts(states, players, args.seed)
+    elapsed = time.perf_counter() - started
+
+    print(f"{args.games} games in {elapsed:.2f}s ({args.games / elapsed:.0f} games/s)")
+    for name, winner in [("X wins", 1), ("O wins", -1), ("draws", 0)]:
+        print(f"{name}: {np.count_nonzero(winners == winner) / args.games:.1%}")
+
+
+if __name__ == "__main__":
+    main()